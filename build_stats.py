@@ -1,7 +1,6 @@
 # External imports
 import argparse
 import datetime
-from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -12,7 +11,9 @@ import yaml
 
 # Internal imports
 from configuration import Configuration
-from processors.processor import Processor
+from players.store import merge_shards
+from processors import scheduler
+from processors.verify import write_discrepancies
 
 # Parse input arguments
 parser = argparse.ArgumentParser()
@@ -21,6 +22,7 @@ parser.add_argument('-y', '--year')
 parser.add_argument('-g', '--game')
 parser.add_argument('-t', '--team')
 parser.add_argument('-j', '--jobs', default=1)
+parser.add_argument('--progress', action='store_true') # show one live progress line
 parser.add_argument('--verify_path', default='') 
 parser.add_argument('--overwrite', action='store_true') # implies default=False
 parser.add_argument('--savestate', default='store_true')
@@ -46,55 +48,37 @@ elif len(input_years) == 1:
 else:
     raise Exception(f'{args.year} pattern is not recognized.')
 
-start = time.time()
-for year in years:
-    # Get list of games for the given year
-    teams_df = pd.read_csv(config.input_path+f'/{year}eve'+f'/TEAM{year}', header=None)
-    teams_df.columns = ['id', 'league', 'city', 'name']
-    # If an individual game is specified in the command line, then process it.
-    if args.game:
-        # Initialize processor
-        proc = Processor(config, 
-                         save_state=False, 
-                         save_stats=True,
-                         overwrite=args.overwrite,
-                         verify_path=args.verify_path)
-        # Validate the given game happened during the current year
-        if year != int(args.game[3:7]):
-            print(f'Warning: {args.agame} is not in {year}')
-            continue
-        team = teams_df.loc[teams_df['id'] == args.game[:3]].iloc[0]
-        print(f'PROCESSING {args.game}')
-        proc.process_team(year, team['id'], team['league'], args.game)
-    # Else, if an indiviual game is specified in the command line, then process it.
-    elif args.team:
-        # Initialize processor
-        proc = Processor(config, 
-                         save_state=False, 
-                         save_stats=True,
-                         overwrite=args.overwrite,
-                         verify_path=args.verify_path)
-        team = teams_df.loc[teams_df['id'] == args.team].iloc[0]
-        print(f"PROCESSING {year} {team['city']} {team['name']}")
-        proc.process_team(year, team['id'], team['league'])
-    # Else, process all games for all teams for the year.
-    else:
-        # Define parameters
-        njobs = int(args.jobs)
-        nteams = len(teams_df)
-        # Initialize processors for each team
-        procs = [Processor(config, 
-                           save_state=False, 
-                           save_stats=True, 
-                           overwrite=args.overwrite,
-                           verify_path=args.verify_path)] * nteams
-        # Define wrapper function to log the parallel execution
-        def proc_wrapper(i):
-            team = teams_df.iloc[i]
-            print(f"PROCESSING {year} {team['city']} {team['name']}")
-            procs[i].process_team(year, team['id'], team['league'])
-        # Launch parallel jobs
-        Parallel(n_jobs=njobs)(delayed(proc_wrapper)(idx) for idx in range(nteams))
+# Worker function for a single task.
+#
+# Builds the player stats for the task's games into the processor's shard and
+# returns the accumulated stats for verification.
+def build_task(config, task, proc_kwargs):
+    proc = scheduler.process_task(config, task, proc_kwargs)
+    return proc.verifier.frame() if proc.verifier else None
 
-    print()
+start = time.time()
+# Queue the tasks for every year up front and run them on one worker pool.
+#
+# If an individual game is specified in the command line, then only process it.
+# Else, if an individual team is specified, then only process its games.
+# Else, process all games for all teams.
+if args.game and not int(args.game[3:7]) in years:
+    print(f'Warning: {args.game} is not in {args.year}')
+tasks = scheduler.build_tasks(config, years, team_id=args.team or '', game_id=args.game or '')
+accums = scheduler.run(config, tasks, int(args.jobs), task_fn=build_task,
+                                                      progress=args.progress,
+                                                      save_state=False,
+                                                      save_stats=True,
+                                                      verify_path=args.verify_path)
+#
+# Merge each worker's shard into the player stats store
+merge_shards(overwrite=args.overwrite)
+#
+# Verify each season's accumulated stats in bulk
+if args.verify_path:
+    for year in years:
+        year_accums = [accum for task, accum in zip(tasks, accums) if task.year == year]
+        if year_accums:
+            write_discrepancies(pd.concat(year_accums, ignore_index=True), args.verify_path, year)
+print()
 print(f'--> Execution time: {time.time() - start}')
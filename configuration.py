@@ -3,13 +3,30 @@ import yaml
 class Configuration(yaml.YAMLObject):
     yaml_tag = u'!Config'
 
+    # Defaults for optional fields.
+    # (yaml doesn't call __init__, so these fill in for fields missing from the file)
+    output_formats = ['csv']
+    stats_bins = {}
+    matchup_feats = []
+    matchup_seasons = [0]
+    team_aggregates = []
+    team_feats = []
+    team_intervals = [10, 30]
+
     def __init__(self, batting_feats,
                        pitching_feats,
                        batting_intervals,
                        pitching_intervals,
                        input_path,
                        output_path,
-                       log_path):
+                       log_path,
+                       output_formats=('csv',),
+                       stats_bins=None,
+                       matchup_feats=(),
+                       matchup_seasons=(0,),
+                       team_aggregates=(),
+                       team_feats=(),
+                       team_intervals=(10, 30)):
         self.batting_feats = batting_feats
         self.pitching_feats = pitching_feats
         self.batting_intervals = batting_intervals
@@ -17,6 +34,13 @@ class Configuration(yaml.YAMLObject):
         self.input_path = input_path
         self.output_path = output_path
         self.log_path = log_path
+        self.output_formats = list(output_formats)
+        self.stats_bins = dict(stats_bins or {})
+        self.matchup_feats = list(matchup_feats)
+        self.matchup_seasons = list(matchup_seasons)
+        self.team_aggregates = list(team_aggregates)
+        self.team_feats = list(team_feats)
+        self.team_intervals = list(team_intervals)
 
     def __repr__(self):
         return """%s(batting_feats=%r,
@@ -25,11 +49,26 @@ class Configuration(yaml.YAMLObject):
                      pitching_intervals=%r,
                      input_path=%r,
                      output_path=%r,
-                     log_path=%r)""" % (
+                     log_path=%r,
+                     output_formats=%r,
+                     stats_bins=%r,
+                     matchup_feats=%r,
+                     matchup_seasons=%r,
+                     team_aggregates=%r,
+                     team_feats=%r,
+                     team_intervals=%r)""" % (
+                self.__class__.__name__,
                 self.batting_feats,
                 self.pitching_feats,
                 self.batting_intervals,
                 self.pitching_intervals,
                 self.input_path,
                 self.output_path,
-                self.log_path)
+                self.log_path,
+                self.output_formats,
+                self.stats_bins,
+                self.matchup_feats,
+                self.matchup_seasons,
+                self.team_aggregates,
+                self.team_feats,
+                self.team_intervals)
@@ -0,0 +1,767 @@
+# This file defines the output backends that write the featurized game states.
+#
+# Every backend receives each finished game's state matrix through write_game().
+# The csv backend writes one file per game, {output_path}/{year}eve/{game}.csv.
+# The columnar backends write one file per season instead, so that a season can
+# be loaded for training with a single read:
+#
+#  - parquet: {output_path}/{year}.parquet, one row group per home team
+#  - npz:     {output_path}/{year}.npz, one array per column
+#  - memmap:  {output_path}/{year}.mat, raw row-major records of the numeric
+#             columns that can be opened with np.memmap, plus an index of the
+#             rows of each game and a schema sidecar (see MemmapBackend.files)
+#  - delta:   {output_path}/{year}.delta.npz, a compressed archive that only
+#             stores the columns that change between states (see DeltaBackend)
+#  - episodes: {output_path}/{year}.episodes.npz, padded [game, state, feature]
+#              tensors for sequence models (see EpisodeBackend), or bucketed by
+#              game length with episode_buckets, {output_path}/{year}.buckets.npz
+#  - events:  {output_path}/{year}.events.parquet, one row per play instead of
+#             per state (see EventBackend)
+#  - transitions: {output_path}/{year}.replay.json and the arrays next to it,
+#                 the states with the action and reward taken in each, as an
+#                 offline replay buffer (see TransitionBackend)
+#
+# The stats format doesn't write the states, it writes the feature statistics
+# used for normalization (see datasets/stats.py).
+#
+# The columnar files have two index columns, game_id and state (the position of
+# the state within its game), and are sorted by them. Their columns are stored
+# in the dtypes declared in datasets/schema.py. If pyarrow isn't installed, the
+# parquet backend falls back to npz.
+#
+# The columns that are constant over a game, like the weather and the final
+# score, are stored once per game in a game table next to the season file,
+# {output_path}/{year}.games.{ext}, and joined back on load. The batter and
+# pitcher are stored as int32 codes from the player vocabulary, see
+# datasets/vocab.py.
+#
+# Merging a season also writes its zone map, the min and max of the common
+# filter columns in every game, to {output_path}/{year}.zones.csv.
+#
+# Like the player stats store, workers never write to a season file directly.
+# Each worker writes the games of its task to its own part file, and finalize()
+# merges the parts into the season file once all workers are finished.
+
+# External imports
+import glob
+import json
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+import os
+import pandas as pd
+import warnings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Internal imports
+from datasets import schema, zones
+from datasets.stats import StatsBackend
+from datasets.transitions import ReplayBuffer, action_cols, event_types, replay_files
+from datasets.vocab import PlayerVocab, player_cols
+
+# Index columns added to the front of the columnar formats
+index_cols = ['game_id', 'state']
+
+
+class CsvBackend:
+    name = 'csv'
+
+    def __init__(self, config, year, part):
+        self.path = config.output_path+f'/{year}eve'
+
+    def write_game(self, game_id, df, actions=None, events=None):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        df.to_csv(self.path+f'/{game_id}.csv', index=False)
+
+    def close(self):
+        pass
+
+    # Every game is already in its final file.
+    @classmethod
+    def finalize(cls, config, year, vocab):
+        pass
+
+
+class ColumnarBackend:
+    name = ''
+    ext = ''
+    # Backend the part files are written with, if not this one
+    part_backend = None
+    # Whether the game columns are split off into a game table
+    game_table = True
+
+    def __init__(self, config, year, part):
+        self.part_path = config.output_path+f'/{year}eve/parts/{self.name}'
+        self.part = part
+        self.frames = []
+        self.games = []
+
+    # Buffers a game's states until the part is closed.
+    #
+    # The columns that are constant over the game (see datasets/schema.py) are
+    # split off into a single row of the game table.
+    #
+    # Input:
+    #  - game_id (str): Retrosheet game id
+    #  - df (Dataframe): game state matrix, one row per state
+    #  - actions (ndarray): optional, [n_states, 3] action and reward of each
+    #                       state, see datasets/transitions.py
+    #  - events (Dataframe): optional, one row per play, see EventBackend
+    #
+    # Output:
+    #  None
+    def write_game(self, game_id, df, actions=None, events=None):
+        df = df.copy()
+        df.insert(0, 'game_id', game_id)
+        df.insert(1, 'state', np.arange(len(df)))
+        df = schema.cast(df)
+        game_cols = [col for col in df.columns if schema.is_game_column(col)]
+        self.games.append(df.loc[:0, ['game_id']+game_cols])
+        self.frames.append(df.drop(columns=game_cols))
+
+    # Writes the buffered games to the part files.
+    def close(self):
+        if not self.frames:
+            return
+        if not os.path.exists(self.part_path):
+            os.makedirs(self.part_path, exist_ok=True)
+        part_file = self.part_path+f'/{self.part}.{self.part_type().ext}'
+        self.part_type().save(pd.concat(self.frames, ignore_index=True), part_file)
+        if self.game_table:
+            self.part_type().save(pd.concat(self.games, ignore_index=True), self.part_type().games_file(part_file))
+        self.frames = []
+        self.games = []
+
+    @classmethod
+    def part_type(cls):
+        return cls.part_backend or cls
+
+    # Path of the game table that goes with a file of states.
+    @classmethod
+    def games_file(cls, path):
+        return path[:-len(cls.ext)]+'games.'+cls.ext
+
+    # Writes a file through a temporary file, so it is never seen half written.
+    @classmethod
+    def save(cls, df, path):
+        cls.write(df, path+'.tmp')
+        os.replace(path+'.tmp', path)
+
+    @classmethod
+    def remove(cls, path):
+        os.remove(path)
+
+    # Merges the season's parts into the season files and removes them.
+    #
+    # Input:
+    #  - config (Configuration): input configuration
+    #  - year (int): season to be merged
+    #  - vocab (PlayerVocab): vocabulary the player ids are encoded with
+    #
+    # Output:
+    #  Dataframe of the season's states if the format has a game table, for
+    #  the zone map, else None
+    @classmethod
+    def finalize(cls, config, year, vocab):
+        ext = cls.part_type().ext
+        parts = sorted(glob.glob(config.output_path+f'/{year}eve/parts/{cls.name}/*.{ext}'))
+        parts = [part for part in parts if not part.endswith('.games.'+ext)]
+        if not parts:
+            return
+        season_file = config.output_path+f'/{year}.{cls.ext}'
+        df = cls.merge(parts, season_file, index_cols, vocab)
+        if cls.game_table:
+            cls.merge([cls.part_type().games_file(part) for part in parts], cls.games_file(season_file),
+                      ['game_id'], vocab)
+        try:
+            os.removedirs(os.path.dirname(parts[0]))
+        except OSError:
+            pass
+        return df if cls.game_table else None
+
+    # Merges part files into a season file and removes them.
+    #
+    # Games in the parts replace the same games in an existing season file, so
+    # re-running part of a season updates it in place.
+    #
+    # Input:
+    #  - parts (list): part files, in the order they should be applied
+    #  - season_file (str): path to the season file
+    #  - key_cols (list): columns that identify a row
+    #  - vocab (PlayerVocab): vocabulary the player ids are encoded with
+    #
+    # Output:
+    #  Dataframe with the merged rows
+    @classmethod
+    def merge(cls, parts, season_file, key_cols, vocab):
+        df = pd.concat([cls.part_type().read(part) for part in parts], ignore_index=True)
+        # If the same game is in more than one part, the last part wins.
+        df = df[~df.duplicated(subset=key_cols, keep='last')]
+        # Parts hold player ids, the season file holds their codes
+        df = vocab.encode(df)
+        if os.path.isfile(season_file):
+            old = cls.read(season_file)
+            old = old[~old['game_id'].isin(df['game_id'])]
+            df = pd.concat([old, df], ignore_index=True)
+        # Game ids start with the home team, so this also groups by team.
+        df = df.sort_values(by=key_cols, kind='stable', ignore_index=True)
+        cls.save(df, season_file)
+        for part in parts:
+            cls.part_type().remove(part)
+        return df
+
+    # Reads the rows of some of the games in a file.
+    #
+    # Formats that can seek to a game override this, the rest read the whole
+    # file (only the requested columns) and filter it.
+    #
+    # Input:
+    #  - path (str): path to the file
+    #  - game_ids (iterable): games to be read
+    #  - columns (list): optional, only read these columns
+    #
+    # Output:
+    #  Dataframe
+    @classmethod
+    def read_games(cls, path, game_ids, columns=None):
+        read_cols = list(dict.fromkeys(['game_id']+columns)) if columns else None
+        df = cls.read(path, columns=read_cols)
+        df = df[df['game_id'].isin(set(game_ids))].reset_index(drop=True)
+        return df[columns] if columns else df
+
+    # Loads a season file with the game table joined back onto every state.
+    #
+    # Input:
+    #  - season_file (str): path to the season file
+    #  - columns (list): optional, only load these columns
+    #  - game_ids (iterable): optional, only load these games
+    #
+    # Output:
+    #  Dataframe
+    @classmethod
+    def load(cls, season_file, columns=None, game_ids=None):
+        read = (lambda path, columns=None: cls.read(path, columns=columns)) if game_ids is None else \
+               (lambda path, columns=None: cls.read_games(path, game_ids, columns=columns))
+        games_file = cls.games_file(season_file)
+        if not os.path.isfile(games_file):
+            return read(season_file, columns=columns)
+        games = read(games_file)
+        game_cols = [col for col in games.columns if col != 'game_id']
+        if columns:
+            games = games[['game_id']+[col for col in game_cols if col in columns]]
+            state_cols = [col for col in columns if not col in game_cols]
+            states = read(season_file, columns=list(dict.fromkeys(['game_id']+state_cols)))
+        else:
+            states = read(season_file)
+        df = states.merge(games, on='game_id', how='left', sort=False)
+        return df[columns] if columns else df
+
+
+class ParquetBackend(ColumnarBackend):
+    name = 'parquet'
+    ext = 'parquet'
+
+    @staticmethod
+    def write(df, path):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        teams = df['game_id'].str[:3].to_numpy()
+        # One row group per home team, so a reader can skip other teams' games
+        bounds = np.flatnonzero(teams[1:] != teams[:-1]) + 1
+        with pq.ParquetWriter(path, table.schema) as writer:
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(df)]):
+                writer.write_table(table.slice(start, end-start))
+
+    @staticmethod
+    def read(path, columns=None):
+        return pq.read_table(path, columns=columns).to_pandas()
+
+    # Only the row groups whose game id range covers one of the games are read.
+    @classmethod
+    def read_games(cls, path, game_ids, columns=None):
+        file = pq.ParquetFile(path)
+        game_ids = sorted(set(game_ids))
+        col = file.schema_arrow.get_field_index('game_id')
+        groups = []
+        for i in range(file.num_row_groups):
+            stats = file.metadata.row_group(i).column(col).statistics
+            # Without statistics the row group can't be ruled out
+            lo = np.searchsorted(game_ids, stats.min) if stats and stats.has_min_max else 0
+            hi = np.searchsorted(game_ids, stats.max, side='right') if stats and stats.has_min_max else len(game_ids)
+            if hi > lo:
+                groups.append(i)
+        read_cols = list(dict.fromkeys(['game_id']+columns)) if columns else None
+        df = file.read_row_groups(groups, columns=read_cols).to_pandas() if groups else \
+             file.schema_arrow.empty_table().to_pandas()[read_cols or slice(None)]
+        df = df[df['game_id'].isin(set(game_ids))].reset_index(drop=True)
+        return df[columns] if columns else df
+
+
+class NpzBackend(ColumnarBackend):
+    name = 'npz'
+    ext = 'npz'
+
+    # Strings are saved as fixed width unicode arrays so the file can be
+    # loaded without pickle. Bool columns are bit-packed, and listed in the
+    # _packed array along with the number of rows in _rows.
+    @staticmethod
+    def write(df, path):
+        arrays = {}
+        packed = []
+        for col in df.columns:
+            values = df[col].to_numpy()
+            if values.dtype == np.bool_:
+                arrays[col] = np.packbits(values)
+                packed.append(col)
+            elif values.dtype.kind in 'biuf':
+                arrays[col] = values
+            else:
+                arrays[col] = values.astype(str)
+        arrays['_packed'] = np.array(packed, dtype=str)
+        arrays['_rows'] = np.array(len(df))
+        with open(path, 'wb') as file:
+            np.savez(file, **arrays)
+
+    @staticmethod
+    def read(path, columns=None):
+        with np.load(path) as data:
+            packed = set(data['_packed'])
+            rows = int(data['_rows'])
+            columns = columns or [col for col in data.files if not col.startswith('_')]
+            return pd.DataFrame({col: np.unpackbits(data[col], count=rows).astype(np.bool_)
+                                      if col in packed else data[col]
+                                 for col in columns})
+
+
+class MemmapBackend(ColumnarBackend):
+    name = 'memmap'
+    ext = 'mat'
+
+    # Paths of the files that make up a matrix, {prefix}.mat.
+    #  - matrix: raw row-major records of the numeric columns, each column in
+    #            its schema dtype
+    #  - index:  csv of game_id -> [start, end) rows of the matrix
+    #  - strings: npy array of the non-numeric columns, row aligned with the matrix
+    #  - schema: json sidecar describing the matrix
+    @staticmethod
+    def files(path):
+        prefix = path[:-len('.mat')]
+        return {'matrix': path,
+                'index': prefix+'.index.csv',
+                'strings': prefix+'.strings.npy',
+                'schema': prefix+'.schema.json'}
+
+    # The schema is written last, so a matrix is only visible once all of its
+    # files are complete.
+    @classmethod
+    def save(cls, df, path):
+        files = cls.files(path)
+        data = df.drop(columns='game_id')
+        numeric = [col for col in data.columns if pd.api.types.is_numeric_dtype(data[col])]
+        strings = [col for col in data.columns if not col in numeric]
+        dtype = np.dtype([(col, data[col].dtype) for col in numeric])
+        sidecar = {'rows': len(df),
+                   'columns': [[col, dtype[col].str] for col in numeric],
+                   'strings': strings}
+        # Games are stored in contiguous blocks of rows
+        game_ids = df['game_id'].to_numpy()
+        starts = np.r_[0, np.flatnonzero(game_ids[1:] != game_ids[:-1]) + 1]
+        index = pd.DataFrame({'game_id': game_ids[starts],
+                              'start': starts,
+                              'end': np.r_[starts[1:], len(df)]})
+        with open(files['matrix']+'.tmp', 'wb') as file:
+            data[numeric].to_records(index=False).astype(dtype).tofile(file)
+        index.to_csv(files['index']+'.tmp', index=False)
+        if strings:
+            with open(files['strings']+'.tmp', 'wb') as file:
+                np.save(file, data[strings].to_numpy().astype(str))
+        with open(files['schema']+'.tmp', 'w') as file:
+            json.dump(sidecar, file, indent=1)
+        if not strings and os.path.isfile(files['strings']):
+            os.remove(files['strings'])
+        for key in ('matrix', 'index', 'strings', 'schema'):
+            if key != 'strings' or strings:
+                os.replace(files[key]+'.tmp', files[key])
+
+    @classmethod
+    def remove(cls, path):
+        for file in cls.files(path).values():
+            if os.path.isfile(file):
+                os.remove(file)
+
+    @classmethod
+    def read(cls, path, columns=None):
+        matrix = SeasonMatrix(path)
+        return cls.read_rows(matrix, matrix.index, columns)
+
+    # Only the rows of the games are read from the matrix.
+    @classmethod
+    def read_games(cls, path, game_ids, columns=None):
+        matrix = SeasonMatrix(path)
+        index = matrix.index[matrix.index['game_id'].isin(set(game_ids))]
+        return cls.read_rows(matrix, index, columns)
+
+    # Reads the rows of the games in a slice of a matrix's index.
+    @staticmethod
+    def read_rows(matrix, index, columns=None):
+        lengths = (index['end'] - index['start']).to_numpy()
+        rows = np.repeat(index['start'].to_numpy(), lengths) + \
+               (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+        fields = [col for col in matrix.columns if not columns or col in columns]
+        records = matrix.matrix[fields][rows] if len(rows) and fields else np.empty(0, dtype=matrix.dtype)[fields]
+        df = pd.DataFrame({col: records[col] for col in fields}, index=pd.RangeIndex(len(rows)))
+        for i, col in enumerate(matrix.strings):
+            if not columns or col in columns:
+                df[col] = matrix.string_values[rows, i]
+        df.insert(0, 'game_id', np.repeat(index['game_id'].to_numpy(), lengths))
+        return df[[col for col in df.columns if not columns or col in columns]]
+
+
+# Memory-mapped view of a matrix written by the memmap backend.
+#
+# Nothing is read until it is sliced, so any game or state can be read without
+# loading the rest of the season. Rows are records with a field per column.
+class SeasonMatrix:
+    def __init__(self, path):
+        files = MemmapBackend.files(path)
+        with open(files['schema'], 'r') as file:
+            sidecar = json.load(file)
+        self.dtype = np.dtype([(col, dtype) for col, dtype in sidecar['columns']])
+        self.columns = list(self.dtype.names)
+        self.strings = sidecar['strings']
+        self.matrix = (np.memmap(files['matrix'], dtype=self.dtype, mode='r', shape=(sidecar['rows'],))
+                       if sidecar['rows'] else np.empty(0, dtype=self.dtype))
+        self.string_values = (np.load(files['strings'], mmap_mode='r') if self.strings
+                              else np.empty((sidecar['rows'], 0), dtype=str))
+        self.index = pd.read_csv(files['index'], dtype={'game_id': str})
+        self.rows = dict(zip(self.index['game_id'], zip(self.index['start'], self.index['end'])))
+        # Constant game features, one record per game
+        games_file = MemmapBackend.games_file(path)
+        self.game_table = SeasonMatrix(games_file) if os.path.isfile(games_file) else None
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    # Rows of a game.
+    def game(self, game_id):
+        start, end = self.rows[game_id]
+        return self.matrix[start:end]
+
+    # Row of a single state of a game.
+    def state(self, game_id, state):
+        start, end = self.rows[game_id]
+        assert(0 <= state < end-start)
+        return self.matrix[start+state]
+
+    # Record of a game's constant features.
+    def game_info(self, game_id):
+        return self.game_table.state(game_id, 0)
+
+    # Converts records from the matrix into a plain float matrix.
+    #
+    # Input:
+    #  - rows (ndarray): records sliced from the matrix
+    #  - columns (list): optional, only these columns in this order
+    #
+    # Output:
+    #  2d float32 array with a column per feature
+    def features(self, rows, columns=None):
+        if columns:
+            rows = rows[columns]
+        return structured_to_unstructured(np.atleast_1d(rows), dtype=np.float32)
+
+
+# Delta encoded archive of a season, for keeping many datasets on disk.
+#
+# Consecutive states only differ in a few columns, so each column is stored as
+# the rows where its value changes and the values it changes to. Every column is
+# also stored in full on the first state of each half-inning (a keyframe), so a
+# half-inning can be decoded without the states before it. The arrays are saved
+# in a compressed npz.
+#
+# Decoding a column is a single np.repeat of its values over the run lengths
+# between the stored rows.
+class DeltaBackend(ColumnarBackend):
+    name = 'delta'
+    ext = 'delta.npz'
+
+    # Columns whose changes start a new keyframe
+    keyframe_cols = ['game_id', 'Inning', 'Bot']
+
+    # Rows where every column is stored in full.
+    @classmethod
+    def keyframes(cls, df):
+        keys = np.zeros(len(df), dtype=np.bool_)
+        keys[:1] = True
+        for col in cls.keyframe_cols:
+            if col in df.columns:
+                values = df[col].to_numpy()
+                keys[1:] |= values[1:] != values[:-1]
+        return keys
+
+    # The state column is left out, it is recounted from the game ids on read.
+    @classmethod
+    def write(cls, df, path):
+        keys = cls.keyframes(df)
+        columns = [col for col in df.columns if col != 'state']
+        arrays = {'_columns': np.array(columns, dtype=str),
+                  '_rows': np.array(len(df)),
+                  '_has_state': np.array('state' in df.columns)}
+        for i, col in enumerate(columns):
+            values = df[col].to_numpy()
+            if values.dtype.kind not in 'biuf':
+                values = values.astype(str)
+            changed = keys.copy()
+            same = values[1:] == values[:-1]
+            if values.dtype.kind == 'f':
+                same |= np.isnan(values[1:]) & np.isnan(values[:-1])
+            changed[1:] |= ~same
+            rows = np.flatnonzero(changed)
+            arrays[f'rows_{i}'] = rows.astype(np.int32)
+            arrays[f'values_{i}'] = values[rows]
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+
+    # Only the requested columns are decoded.
+    @classmethod
+    def read(cls, path, columns=None):
+        with np.load(path) as data:
+            stored = list(data['_columns'])
+            n = int(data['_rows'])
+            if not columns:
+                columns = stored[:1]+['state']+stored[1:] if data['_has_state'] else stored
+            decode = lambda i: np.repeat(data[f'values_{i}'],
+                                         np.diff(np.r_[data[f'rows_{i}'], n]))
+            df = pd.DataFrame({col: decode(stored.index(col))
+                               for col in columns if col != 'state'})
+            if 'state' in columns:
+                game_ids = decode(stored.index('game_id'))
+                starts = np.r_[0, np.flatnonzero(game_ids[1:] != game_ids[:-1]) + 1]
+                state = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+                df.insert(columns.index('state'), 'state', state.astype(schema.column_dtype('state')))
+            return df
+
+
+# Padded episode tensors of a season, for sequence models that consume whole
+# games.
+#
+# Each game is an episode. The states of a season are saved as a float32 tensor
+# of shape [n_games, max_states, n_features], padded with zeros after the end
+# of each game, along with the length and game id of every episode. The game
+# table is saved as a plain npz.
+#
+# With bucket_width set, games are grouped into buckets by length and each
+# bucket is padded to its own longest game, which wastes less space on padding.
+# Bucket b holds the games with between b*bucket_width+1 and (b+1)*bucket_width
+# states. Buckets are saved as states_{b}, lengths_{b} and game_ids_{b}.
+#
+# Parts are written as npz, the tensors are built when the season is merged.
+class EpisodeBackend(ColumnarBackend):
+    name = 'episodes'
+    ext = 'episodes.npz'
+    part_backend = NpzBackend
+    bucket_width = None
+
+    @classmethod
+    def write(cls, df, path):
+        if not 'state' in df.columns:
+            NpzBackend.write(df, path)
+            return
+        columns = [col for col in df.columns if not col in index_cols]
+        game_ids, starts, lengths = np.unique(df['game_id'].to_numpy(), return_index=True,
+                                                                        return_counts=True)
+        order = np.argsort(starts)
+        game_ids, starts, lengths = game_ids[order], starts[order], lengths[order]
+        if cls.bucket_width:
+            buckets = (lengths-1) // cls.bucket_width
+        else:
+            buckets = np.zeros(len(lengths), dtype=np.int64)
+        values = df[columns].to_numpy(dtype=np.float32)
+        arrays = {'_columns': np.array(columns, dtype=str),
+                  '_buckets': np.array(buckets.max()+1 if len(buckets) else 0)}
+        for b in range(int(arrays['_buckets'])):
+            games = np.flatnonzero(buckets == b)
+            max_states = lengths[games].max() if len(games) else 0
+            states = np.zeros((len(games), max_states, len(columns)), dtype=np.float32)
+            # Scatter every row of the bucket's games into its (episode, step) slot
+            episode = np.repeat(np.arange(len(games)), lengths[games])
+            step = np.concatenate([np.arange(n) for n in lengths[games]]) if len(games) else episode
+            rows = np.repeat(starts[games], lengths[games]) + step
+            states[episode, step] = values[rows]
+            arrays[f'states_{b}'] = states
+            arrays[f'lengths_{b}'] = lengths[games].astype(np.int32)
+            arrays[f'game_ids_{b}'] = game_ids[games].astype(str)
+        with open(path, 'wb') as file:
+            np.savez(file, **arrays)
+
+    # Unpads the episodes back into rows, in the dtypes of the schema.
+    @classmethod
+    def read(cls, path, columns=None):
+        with np.load(path) as data:
+            if not '_buckets' in data.files:
+                return NpzBackend.read(path, columns=columns)
+            stored = list(data['_columns'])
+            frames = []
+            for b in range(int(data['_buckets'])):
+                lengths = data[f'lengths_{b}']
+                mask = np.arange(data[f'states_{b}'].shape[1]) < lengths[:, None]
+                df = pd.DataFrame(data[f'states_{b}'][mask], columns=stored)
+                df.insert(0, 'game_id', np.repeat(data[f'game_ids_{b}'], lengths))
+                df.insert(1, 'state', np.nonzero(mask)[1])
+                frames.append(df)
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=index_cols+stored)
+        df = df.sort_values(by=index_cols, kind='stable', ignore_index=True)
+        df = df.astype({col: np.int32 if col in player_cols else schema.column_dtype(col)
+                        for col in df.columns if col != 'game_id'})
+        return df[columns] if columns else df
+
+
+class BucketedEpisodeBackend(EpisodeBackend):
+    name = 'episode_buckets'
+    ext = 'buckets.npz'
+    bucket_width = 16
+
+
+# Transitions of a season, for offline reinforcement learning.
+#
+# Each state is stored with the action taken in it and the runs it scored (see
+# datasets/transitions.py). The states are saved as a float32 [n, n_features]
+# npy array that can be opened with np.memmap, with row aligned arrays of the
+# actions, rewards, done flags and game ids. The next state s' isn't stored
+# again, it is the next row. The game features are kept on every state, so
+# there is no game table, and the labels are left out of the states.
+#
+# Parts are written as npz, the arrays are built when the season is merged.
+class TransitionBackend(ColumnarBackend):
+    name = 'transitions'
+    ext = 'replay.json'
+    part_backend = NpzBackend
+    game_table = False
+
+    def write_game(self, game_id, df, actions=None, events=None):
+        assert(actions is not None and len(actions) == len(df)), f'No actions for the states of {game_id}'
+        df = df.copy()
+        df.insert(0, 'game_id', game_id)
+        df.insert(1, 'state', np.arange(len(df)))
+        for i, col in enumerate(action_cols):
+            df[col] = actions[:, i]
+        self.frames.append(schema.cast(df))
+
+    # The schema sidecar, the season file itself, is written last.
+    @classmethod
+    def save(cls, df, path):
+        files = replay_files(path)
+        # The labels would give the outcome away, the rewards stand in for them
+        columns = [col for col in df.columns if not col in index_cols+action_cols+schema.label_columns]
+        game_ids = df['game_id'].to_numpy().astype(str)
+        arrays = {'states': df[columns].to_numpy(dtype=np.float32),
+                  'actions': df[['event', 'advance']].to_numpy(dtype=np.int16),
+                  'rewards': df['reward'].to_numpy(dtype=np.int8),
+                  'dones': np.r_[game_ids[1:] != game_ids[:-1], len(df) > 0].astype(np.bool_),
+                  'game_ids': game_ids}
+        for key, values in arrays.items():
+            with open(files[key]+'.tmp', 'wb') as file:
+                np.save(file, values)
+        with open(files['schema']+'.tmp', 'w') as file:
+            json.dump({'rows': len(df), 'columns': columns, 'event_types': event_types}, file, indent=1)
+        for key in list(arrays)+['schema']:
+            os.replace(files[key]+'.tmp', files[key])
+
+    @classmethod
+    def read(cls, path, columns=None):
+        replay = ReplayBuffer(path)
+        df = pd.DataFrame(np.asarray(replay.states), columns=replay.columns)
+        game_ids = np.asarray(replay.game_ids)
+        starts = np.r_[0, np.flatnonzero(game_ids[1:] != game_ids[:-1]) + 1]
+        df.insert(0, 'game_id', game_ids)
+        df.insert(1, 'state', np.arange(len(df)) - np.repeat(starts, np.diff(np.r_[starts, len(df)])))
+        df['event'] = replay.actions[:, 0]
+        df['advance'] = replay.actions[:, 1]
+        df['reward'] = np.asarray(replay.rewards)
+        df = df.astype({col: np.int32 if col in player_cols else schema.column_dtype(col)
+                        for col in df.columns if col != 'game_id'})
+        return df[columns] if columns else df
+
+
+# Event table of a season, one row per play, for analytics that work with plays
+# rather than states (in the spirit of Chadwick's cwevent).
+#
+# The rows are keyed by game_id and state, the state the play was made from, so
+# they join directly onto the states. Each row holds the situation before the
+# play, the batter and pitcher, the count and pitch sequence, the Retrosheet
+# event text, the event type id (see datasets/transitions.py), the batted ball
+# type, the runner advancement code, and the runs, RBIs and outs on the play.
+#
+# The table is written as parquet, or npz if pyarrow isn't installed.
+class EventTable:
+    name = 'events'
+    part_backend = NpzBackend
+    game_table = False
+
+    def write_game(self, game_id, df, actions=None, events=None):
+        if events is None or not len(events):
+            return
+        events = events.copy()
+        events.insert(0, 'game_id', game_id)
+        self.frames.append(schema.cast(events))
+
+
+class EventBackend(EventTable, ParquetBackend):
+    ext = 'events.parquet'
+
+
+class NpzEventBackend(EventTable, NpzBackend):
+    ext = 'events.npz'
+
+
+# Output formats by name
+backend_types = {'csv': CsvBackend,
+                 'parquet': ParquetBackend,
+                 'npz': NpzBackend,
+                 'memmap': MemmapBackend,
+                 'delta': DeltaBackend,
+                 'episodes': EpisodeBackend,
+                 'episode_buckets': BucketedEpisodeBackend,
+                 'transitions': TransitionBackend,
+                 'events': EventBackend,
+                 'stats': StatsBackend}
+
+# Looks up the backend class for an output format.
+def backend_type(fmt):
+    assert(fmt in backend_types), f'Unknown output format {fmt}'
+    if fmt == 'parquet' and pa is None:
+        warnings.warn('pyarrow is not installed, writing npz instead of parquet')
+        return NpzBackend
+    if fmt == 'events' and pa is None:
+        warnings.warn('pyarrow is not installed, writing the event table as npz')
+        return NpzEventBackend
+    return backend_types[fmt]
+
+# Creates a backend for each of the configured output formats.
+#
+# Input:
+#  - config (Configuration): input configuration
+#  - year (int): season being processed
+#  - part (str): name of the part written by this task
+#
+# Output:
+#  List of backends
+def open_backends(config, year, part):
+    return [backend_type(fmt)(config, year, part) for fmt in config.output_formats]
+
+# Merges the parts of the configured output formats for a season.
+#
+# Every format with a game table holds the same states, so the season's zone
+# map is built once from the first of them.
+def finalize(config, year):
+    vocab = PlayerVocab(config.output_path)
+    zoned = False
+    for fmt in config.output_formats:
+        df = backend_type(fmt).finalize(config, year, vocab)
+        if df is not None and not zoned:
+            zones.save(df, config.output_path+f'/{year}.zones.csv')
+            zoned = True
@@ -0,0 +1,69 @@
+# This file defines the labels added to the end of each game's state matrix.
+#
+# The labels are computed once a game is finished, from its state columns and
+# the action taken in each state (see datasets/transitions.py), with whole
+# column operations over the game instead of a pass per state:
+#
+#  - away_final, home_final: final score
+#  - home_win: True if the home team won
+#  - runs_rest_inning: runs the team at bat scores from this state to the end of
+#                      the half-inning, a reverse cumulative sum of the runs
+#                      scored on each play within the half-inning
+#  - runs_rest_game: runs the team at bat scores from this state to the end of
+#                    the game
+#  - next_base_out: base-out code of the state after this state's play, see
+#                   base_out_code(), or end_of_inning if the play made the
+#                   third out
+
+# External imports
+import numpy as np
+
+# Internal imports
+from datasets.transitions import decode_advance
+
+# Base-out code of a half-inning that is over
+end_of_inning = 24
+
+# Encodes the outs and runners of states as one of the 24 base-out states,
+# outs*8 + 1B + 2*2B + 4*3B.
+def base_out_code(outs, first, second, third):
+    return (np.asarray(outs, dtype=np.int8)*8 + np.asarray(first, dtype=np.int8)
+            + np.asarray(second, dtype=np.int8)*2 + np.asarray(third, dtype=np.int8)*4)
+
+# Adds the labels to a finished game's state matrix.
+#
+# Input:
+#  - df (Dataframe): game state matrix, one row per state
+#  - actions (ndarray): [n_states, 3] action and reward of each state
+#  - final (list): final score, [away, home]
+#
+# Output:
+#  None, the label columns are added to df
+def add_labels(df, actions, final):
+    runs = actions[:, 2].astype(np.int16)
+    bot = df['Bot'].to_numpy().astype(np.bool_)
+    inning = df['Inning'].to_numpy().astype(np.int16)
+    outs = df['Outs'].to_numpy().astype(np.int8)
+    #
+    # Final score
+    df['away_final'] = np.full(len(df), final[0], dtype=np.float64)
+    df['home_final'] = np.full(len(df), final[1], dtype=np.float64)
+    df['home_win'] = np.full(len(df), final[1] > final[0])
+    #
+    # Runs from each state on, suffix[i] = runs[i:].sum()
+    suffix = np.cumsum(runs[::-1])[::-1]
+    # Half-innings are runs of states with the same inning and team at bat
+    starts = np.r_[True, (inning[1:] != inning[:-1]) | (bot[1:] != bot[:-1])]
+    half = np.cumsum(starts) - 1
+    ends = np.r_[np.flatnonzero(starts)[1:], len(df)]
+    df['runs_rest_inning'] = suffix - np.r_[suffix, 0][ends][half]
+    home_suffix = np.cumsum((runs*bot)[::-1])[::-1]
+    df['runs_rest_game'] = np.where(bot, home_suffix, suffix - home_suffix)
+    #
+    # Base-out state after the play. Substitutions don't change it.
+    advance = decode_advance(actions[:, 1])
+    next_outs = outs + (advance == 5).sum(axis=1)
+    next_code = np.where(next_outs >= 3, end_of_inning,
+                         base_out_code(np.minimum(next_outs, 2), *[(advance == base).any(axis=1) for base in (1, 2, 3)]))
+    code = base_out_code(outs, *[df[base].to_numpy().astype(np.bool_) for base in ('1B', '2B', '3B')])
+    df['next_base_out'] = np.where(actions[:, 0] == 0, code, next_code)
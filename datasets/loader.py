@@ -0,0 +1,157 @@
+# This file defines a minibatch loader over the built columnar datasets.
+#
+# The seasons are split into shards: one per season for the npz and delta
+# formats, which can only be read whole, and runs of games for the memmap and
+# parquet formats, which can seek to a game. A background thread reads the next
+# shards while the current one is being consumed, so a training loop is fed
+# without holding more than a few shards in memory.
+#
+# Rows are shuffled through a buffer: each shard is added to the buffer, the
+# buffer is permuted, and batches are taken from it until it is back down to
+# its size. Every random draw comes from a generator seeded with (seed, epoch),
+# so the same seed and epoch always give the same batches.
+#
+# Example:
+#   loader = DataLoader(config.output_path, range(2000, 2021), columns=['Inning', 'Outs', 'Bot'],
+#                       batch_size=512, shuffle_buffer=100000, seed=0)
+#   for epoch in range(10):
+#       for batch in loader.epoch(epoch):
+#           ...  # batch is a float32 array of shape [batch_size, 3]
+
+# External imports
+import numpy as np
+import os
+import queue
+import threading
+
+# Internal imports
+from datasets.backends import MemmapBackend, ParquetBackend, index_cols
+from datasets.query import query_order
+from datasets.reader import find_season
+
+# Formats that can read a run of games without reading the whole season
+seekable = (MemmapBackend, ParquetBackend)
+
+
+class DataLoader:
+    # Input:
+    #  - output_path (str): output path from the configuration
+    #  - years (iterable): seasons to be loaded
+    #  - columns (list): optional, feature columns in each batch, default every
+    #                    numeric column except the index columns
+    #  - batch_size (int): optional, rows per batch
+    #  - shuffle_buffer (int): optional, rows held back to shuffle with, 0 to
+    #                          keep the rows in order
+    #  - games_per_shard (int): optional, games read at a time from the formats
+    #                           that can seek to a game
+    #  - prefetch (int): optional, shards read ahead by the background thread
+    #  - seed (int): optional, seed of the shuffles
+    #  - drop_last (bool): optional, drop the last batch of an epoch if it is short
+    #  - dtype: optional, dtype of the batches
+    def __init__(self, output_path, years, columns=None, batch_size=256, shuffle_buffer=0,
+                 games_per_shard=500, prefetch=2, seed=0, drop_last=False, dtype=np.float32):
+        assert(batch_size > 0), 'batch_size must be positive'
+        assert(prefetch > 0), 'prefetch must be positive'
+        self.output_path = output_path
+        self.columns = list(columns) if columns else None
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.prefetch = prefetch
+        self.seed = seed
+        self.drop_last = drop_last
+        self.dtype = dtype
+        # (backend, season file, game ids or None for the whole season)
+        self.shards = []
+        for year in years:
+            backend, season_file = find_season(output_path, year, order=query_order)
+            games_file = backend.games_file(season_file)
+            if not backend in seekable or not os.path.isfile(games_file):
+                self.shards.append((backend, season_file, None))
+                continue
+            game_ids = backend.read(games_file, columns=['game_id'])['game_id'].to_numpy()
+            for i in range(0, len(game_ids), games_per_shard):
+                self.shards.append((backend, season_file, game_ids[i:i+games_per_shard]))
+
+    def __iter__(self):
+        return self.epoch(0)
+
+    # Reads a shard into an array of the feature columns.
+    def read(self, shard):
+        backend, season_file, game_ids = shard
+        df = backend.load(season_file, columns=self.columns, game_ids=game_ids)
+        if self.columns is None:
+            self.columns = [col for col in df.columns if not col in index_cols and df[col].dtype.kind in 'biuf']
+        return df[self.columns].to_numpy(dtype=self.dtype)
+
+    # Reads the shards in order on a background thread, keeping up to
+    # self.prefetch of them ready.
+    def prefetched(self, shards):
+        ready = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def work():
+            for shard in shards:
+                try:
+                    item = self.read(shard)
+                except Exception as e:
+                    item = e
+                # Give up if the consumer has gone away
+                while not stop.is_set():
+                    try:
+                        ready.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set() or isinstance(item, Exception):
+                    return
+
+        # The first shard sets the columns if they weren't given, so it is read
+        # before the thread starts.
+        if self.columns is None and shards:
+            first = self.read(shards[0])
+            shards = shards[1:]
+        else:
+            first = None
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        try:
+            if first is not None:
+                yield first
+            for _ in shards:
+                item = ready.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    # Iterates over one epoch of batches.
+    #
+    # Input:
+    #  - epoch (int): optional, epoch number, the shuffles are seeded with
+    #                 (seed, epoch)
+    #
+    # Output:
+    #  Generator of arrays of shape [batch_size, len(self.columns)]
+    def epoch(self, epoch=0):
+        rng = np.random.default_rng([self.seed, epoch])
+        shards = self.shards
+        if self.shuffle_buffer:
+            shards = [shards[i] for i in rng.permutation(len(shards))]
+        buffer = None
+        for values in self.prefetched(shards):
+            buffer = values if buffer is None else np.concatenate([buffer, values])
+            if self.shuffle_buffer:
+                buffer = buffer[rng.permutation(len(buffer))]
+            # Keep the buffer topped up so rows from the next shard mix in
+            n = (max(len(buffer) - self.shuffle_buffer, 0) // self.batch_size) * self.batch_size
+            for i in range(0, n, self.batch_size):
+                yield buffer[i:i+self.batch_size]
+            buffer = buffer[n:]
+        if buffer is None:
+            return
+        for i in range(0, len(buffer), self.batch_size):
+            batch = buffer[i:i+self.batch_size]
+            if len(batch) < self.batch_size and self.drop_last:
+                return
+            yield batch
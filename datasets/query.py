@@ -0,0 +1,155 @@
+# This file defines queries that extract the matching states from the built
+# datasets.
+#
+# A query is a list of predicates on single columns, all of which must hold,
+# e.g. ['Inning>=9', 'margin<=2'] for the 9th inning or later with the score
+# within two runs. Predicates can use any state or game column, or one of the
+# derived columns in datasets/zones.py (diff, margin, runners).
+#
+# Before any states are read, the predicates are checked against the season's
+# zone map, so seasons and games that can't contain a match are skipped. Only
+# the columns that are returned or filtered on are read, and the formats that
+# can seek to a game (memmap and parquet) only read the remaining games.
+
+# External imports
+import numpy as np
+import operator
+import os
+import pandas as pd
+import re
+
+# Internal imports
+from datasets import zones
+from datasets.backends import DeltaBackend, MemmapBackend, NpzBackend, ParquetBackend, index_cols
+from datasets.reader import find_season
+from datasets.vocab import PlayerVocab
+
+# Comparison operators by symbol
+ops = {'==': operator.eq,
+       '!=': operator.ne,
+       '<=': operator.le,
+       '>=': operator.ge,
+       '<': operator.lt,
+       '>': operator.gt}
+
+predicate_ptrn = re.compile(r'^\s*([\w%/]+)\s*(==|!=|<=|>=|<|>)\s*(-?\d+(\.\d+)?)\s*$')
+
+# Formats in order of preference, the ones that can skip games first
+query_order = (MemmapBackend, ParquetBackend, NpzBackend, DeltaBackend)
+
+
+# Parses a predicate string, e.g. 'Inning>=9'.
+#
+# Output:
+#  (column, operator symbol, value)
+def parse(predicate):
+    match = predicate_ptrn.match(predicate)
+    assert(match), f'Predicate {predicate} is not recognized'
+    return match.group(1), match.group(2), float(match.group(3))
+
+# Checks which zones could hold a value that satisfies a predicate.
+#
+# Input:
+#  - low (ndarray): min of the column in each zone
+#  - high (ndarray): max of the column in each zone
+#  - op (str): operator symbol
+#  - value (float): value compared against
+#
+# Output:
+#  Boolean array, False where no value in the zone can match
+def may_match(low, high, op, value):
+    if op == '==':
+        return (low <= value) & (value <= high)
+    if op == '!=':
+        return ~((low == value) & (high == value))
+    if op in ('<', '<='):
+        return ops[op](low, value)
+    return ops[op](high, value)
+
+# Picks the games of a season that could match every predicate.
+#
+# Input:
+#  - zone_map (Dataframe): season zone map from datasets/zones.py
+#  - predicates (list): parsed predicates
+#
+# Output:
+#  Array of candidate game ids
+def candidate_games(zone_map, predicates):
+    keep = np.ones(len(zone_map), dtype=np.bool_)
+    for col, op, value in predicates:
+        if 'min_'+col in zone_map.columns:
+            keep &= may_match(zone_map['min_'+col].to_numpy(), zone_map['max_'+col].to_numpy(), op, value)
+    return zone_map['game_id'].to_numpy()[keep]
+
+# Removes the candidate games whose constant game information fails a
+# predicate, e.g. 'temp>=80'. The game table is small enough to read whole.
+#
+# Output:
+#  Array of candidate game ids
+def filter_games(backend, season_file, game_ids, predicates):
+    games_file = backend.games_file(season_file)
+    if not os.path.isfile(games_file):
+        return game_ids
+    games = backend.read(games_file)
+    game_preds = [(col, op, value) for col, op, value in predicates if col in games.columns]
+    if not game_preds:
+        return game_ids
+    keep = np.ones(len(games), dtype=np.bool_)
+    for col, op, value in game_preds:
+        keep &= ops[op](games[col].to_numpy(), value)
+    return np.intersect1d(game_ids, games['game_id'].to_numpy()[keep])
+
+# Extracts the states matching every predicate.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - years (iterable): seasons to be searched
+#  - predicates (list): predicate strings, e.g. ['Inning>=9', 'margin<=2']
+#  - columns (list): optional, only return these columns (plus the index)
+#  - player_ids (bool): optional, return Retrosheet ids instead of codes
+#
+# Output:
+#  Dataframe of the matching states, and a dict with the number of seasons,
+#  games and rows that were read and skipped
+def extract(output_path, years, predicates, columns=None, player_ids=False):
+    predicates = [parse(p) for p in predicates]
+    report = {'seasons': 0, 'seasons_skipped': 0, 'games': 0, 'games_skipped': 0, 'rows_read': 0}
+    frames = []
+    for year in years:
+        # Whole seasons can be ruled out by the year
+        if not all(ops[op](year, value) for col, op, value in predicates if col == 'year'):
+            report['seasons_skipped'] += 1
+            continue
+        backend, season_file = find_season(output_path, year, order=query_order)
+        zone_map = zones.load(output_path+f'/{year}.zones.csv')
+        game_ids = None
+        if zone_map is not None:
+            game_ids = candidate_games(zone_map, predicates)
+            # Predicates on the game table are checked against the table
+            game_ids = filter_games(backend, season_file, game_ids, predicates)
+            report['games'] += len(game_ids)
+            report['games_skipped'] += len(zone_map) - len(game_ids)
+            if not len(game_ids):
+                report['seasons_skipped'] += 1
+                continue
+        report['seasons'] += 1
+        # Read the returned columns and the columns needed to evaluate the predicates
+        read_cols = None
+        if columns:
+            needed = []
+            for col, _, _ in predicates:
+                needed += zones.derived_deps.get(col, [col])
+            read_cols = list(dict.fromkeys(index_cols+columns+needed))
+        df = backend.load(season_file, columns=read_cols, game_ids=game_ids)
+        report['rows_read'] += len(df)
+        df = zones.add_derived(df, cols=[col for col, _, _ in predicates])
+        mask = np.ones(len(df), dtype=np.bool_)
+        for col, op, value in predicates:
+            mask &= ops[op](df[col].to_numpy(), value)
+        df = df[mask]
+        frames.append(df[list(dict.fromkeys(index_cols+columns))] if columns else
+                      df[[col for col in df.columns if not col in zones.derived_cols]])
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=index_cols+(columns or []))
+    if player_ids:
+        df = PlayerVocab(output_path).decode(df)
+    return df, report
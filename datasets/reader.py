@@ -0,0 +1,117 @@
+# This file defines the readers for the per-season datasets written by the
+# columnar output backends (see datasets/backends.py).
+
+# External imports
+import numpy as np
+import os
+
+# Internal imports
+from datasets.backends import (BucketedEpisodeBackend, DeltaBackend, EpisodeBackend, EventBackend, MemmapBackend,
+                               NpzBackend, NpzEventBackend, ParquetBackend, SeasonMatrix, TransitionBackend, pa)
+from datasets.transitions import ReplayBuffer
+from datasets.vocab import PlayerVocab
+
+# Order the season files are looked for in by load_season()
+read_order = (ParquetBackend, NpzBackend, MemmapBackend, DeltaBackend)
+
+# Finds a season's columnar file.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - year (int): season to be found
+#  - order (tuple): optional, backends in order of preference
+#
+# Output:
+#  (backend, path to the season file)
+def find_season(output_path, year, order=read_order):
+    for backend in order:
+        if issubclass(backend, ParquetBackend) and pa is None:
+            continue
+        season_file = output_path+f'/{year}.{backend.ext}'
+        if os.path.isfile(season_file):
+            return backend, season_file
+    raise FileNotFoundError(f'No columnar dataset for {year} in {output_path}')
+
+# Loads a season of game states.
+#
+# The parquet file is read if it exists and pyarrow is installed, otherwise the
+# npz file, the memmap matrix or the delta archive is read.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - year (int): season to be loaded
+#  - columns (list): optional, only load these columns
+#  - player_ids (bool): optional, return the batter and pitcher as Retrosheet
+#                       ids instead of vocabulary codes
+#
+# Output:
+#  Dataframe with the game_id and state index columns, the state features and
+#  the game features
+def load_season(output_path, year, columns=None, player_ids=False):
+    backend, season_file = find_season(output_path, year)
+    df = backend.load(season_file, columns=columns)
+    return PlayerVocab(output_path).decode(df) if player_ids else df
+
+# Loads a season's event table, one row per play.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - year (int): season to be loaded
+#  - columns (list): optional, only load these columns
+#  - player_ids (bool): optional, return the batter and pitcher as Retrosheet
+#                       ids instead of vocabulary codes
+#
+# Output:
+#  Dataframe with the game_id and state index columns, join it onto the states
+#  loaded with load_season() to get the features of each play
+def load_events(output_path, year, columns=None, player_ids=False):
+    backend, season_file = find_season(output_path, year, order=(EventBackend, NpzEventBackend))
+    df = backend.load(season_file, columns=columns)
+    return PlayerVocab(output_path).decode(df) if player_ids else df
+
+# Opens a season's memmap matrix without reading it.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - year (int): season to be opened
+#
+# Output:
+#  SeasonMatrix, slice it with .game(game_id) or .state(game_id, state)
+def open_season(output_path, year):
+    return SeasonMatrix(output_path+f'/{year}.{MemmapBackend.ext}')
+
+# Loads a season's padded episode tensors.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - year (int): season to be loaded
+#  - bucketed (bool): optional, load the episodes bucketed by game length
+#
+# Output:
+#  List with a (states, lengths, game_ids) tuple per non-empty bucket, where
+#  states has shape [n_games, max_states, n_features], and the list of feature
+#  names
+def load_episodes(output_path, year, bucketed=False):
+    backend = BucketedEpisodeBackend if bucketed else EpisodeBackend
+    with np.load(output_path+f'/{year}.{backend.ext}') as data:
+        buckets = [(data[f'states_{b}'], data[f'lengths_{b}'], data[f'game_ids_{b}'])
+                   for b in range(int(data['_buckets'])) if len(data[f'lengths_{b}'])]
+        return buckets, list(data['_columns'])
+
+# Opens a season's transitions as a replay buffer without reading them.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - year (int): season to be opened
+#
+# Output:
+#  ReplayBuffer, sample (s, a, r, s', done) batches with .sample(batch_size)
+def open_replay(output_path, year):
+    return ReplayBuffer(output_path+f'/{year}.{TransitionBackend.ext}')
+
+# Loads the player vocabulary of the datasets in the output path.
+#
+# Output:
+#  PlayerVocab, .ids[code] is the Retrosheet id of a code
+def load_vocab(output_path):
+    return PlayerVocab(output_path)
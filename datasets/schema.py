@@ -0,0 +1,91 @@
+# This file defines the output schema of the game state matrix.
+#
+# Every feature declares the smallest dtype that holds its values, and the
+# binary backends store each column in its declared dtype instead of float64:
+#
+#  - bool:  flags and one-hot columns (bit-packed by parquet and npz)
+#  - int8:  small counts, e.g. inning and outs
+#  - int16: scores, year, park factor, weather readings
+#  - float32: player stats, which can be fractional or missing (NaN)
+#
+# Columns without a declared dtype, the player stat features, default to
+# float32. The player id columns are kept as strings.
+
+# External imports
+import numpy as np
+
+# Dtypes of the state and game info features
+column_dtypes = {'state': np.int16,
+                 'Inning': np.int8,
+                 'Bot': np.bool_,
+                 'Outs': np.int8,
+                 'Away': np.int16,
+                 'Home': np.int16,
+                 '1B': np.bool_,
+                 '2B': np.bool_,
+                 '3B': np.bool_,
+                 'batter': str,
+                 'pitcher': str,
+                 'year': np.int16,
+                 'parkfactor': np.int16,
+                 'temp': np.int16,
+                 'windspeed': np.int16,
+                 'away_final': np.int16,
+                 'home_final': np.int16,
+                 'home_win': np.bool_,
+                 'runs_rest_inning': np.int8,
+                 'runs_rest_game': np.int16,
+                 'next_base_out': np.int8,
+                 # Action and reward of the transitions format
+                 'event': np.int8,
+                 'advance': np.int16,
+                 'reward': np.int8,
+                 # Event table columns
+                 'balls': np.int8,
+                 'strikes': np.int8,
+                 'pitches': str,
+                 'event_text': str,
+                 'event_type': np.int8,
+                 'hit_type': str,
+                 'runs': np.int8,
+                 'rbi': np.int8,
+                 'outs_on_play': np.int8,
+                 'pa_end': np.bool_}
+
+# Dtypes of the one-hot game info features, by prefix
+prefix_dtypes = {'winddir_': np.bool_,
+                 'fieldcond_': np.bool_,
+                 'precips_': np.bool_,
+                 'sky_': np.bool_}
+
+default_dtype = np.float32
+
+# Columns that are constant over a game: the game info features and final score.
+# The columnar backends store them once per game instead of on every state.
+game_columns = ['year', 'parkfactor', 'temp', 'windspeed', 'away_final', 'home_final', 'home_win']
+game_prefixes = ['winddir_', 'fieldcond_', 'precips_', 'sky_']
+
+# Label columns added at the end of every game, see datasets/labels.py
+label_columns = ['away_final', 'home_final', 'home_win', 'runs_rest_inning', 'runs_rest_game', 'next_base_out']
+
+def is_game_column(col):
+    return col in game_columns or any(col.startswith(prefix) for prefix in game_prefixes)
+
+# Looks up the declared dtype of a column.
+def column_dtype(col):
+    if col in column_dtypes:
+        return column_dtypes[col]
+    for prefix, dtype in prefix_dtypes.items():
+        if col.startswith(prefix):
+            return dtype
+    return default_dtype
+
+# Casts the columns of a game state matrix to their declared dtypes.
+#
+# Input:
+#  - df (Dataframe): game state matrix, with or without the game_id column
+#
+# Output:
+#  Dataframe with typed columns
+def cast(df):
+    return df.astype({col: column_dtype(col) for col in df.columns if col != 'game_id'})
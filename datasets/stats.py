@@ -0,0 +1,224 @@
+# This file defines the streaming feature statistics written with the dataset.
+#
+# The statistics of every numeric feature column are accumulated as the games
+# are produced, so consumers can normalize the features without a separate pass
+# over the data. For each column:
+#
+#  - count, mean and m2 (sum of squared deviations, variance = m2/count),
+#    updated with Welford's method
+#  - min and max
+#  - nulls and zeros, the number of missing and zero values
+#  - optionally, a histogram over fixed bins (see Configuration.stats_bins)
+#
+# Accumulators from different workers, and from different seasons, are
+# combined with merge(), which gives the same result as one pass over all rows.
+
+# External imports
+import glob
+import numpy as np
+import os
+import pandas as pd
+import warnings
+
+# Internal imports
+from datasets import schema
+
+
+class StreamingStats:
+    # Input:
+    #  - columns (list): feature columns
+    #  - bins (dict): optional, column -> [low, high, number of bins]
+    def __init__(self, columns, bins=None):
+        self.columns = list(columns)
+        n = len(self.columns)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        self.nulls = np.zeros(n, dtype=np.int64)
+        self.zeros = np.zeros(n, dtype=np.int64)
+        self.bins = {col: np.linspace(low, high, int(nbins)+1)
+                     for col, (low, high, nbins) in (bins or {}).items() if col in self.columns}
+        self.hist = {col: np.zeros(len(edges)-1, dtype=np.int64) for col, edges in self.bins.items()}
+        # Games that have been accumulated
+        self.games = []
+
+    # Adds a batch of rows.
+    #
+    # Input:
+    #  - values (ndarray): 2d array with a column per feature column
+    #
+    # Output:
+    #  None
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        total = np.where(valid, values, 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, 0)
+        m2 = (np.where(valid, values - mean, 0)**2).sum(axis=0)
+        self.combine(count, mean, m2)
+        if len(values):
+            self.min = np.fmin(self.min, np.nanmin(np.where(valid, values, np.inf), axis=0))
+            self.max = np.fmax(self.max, np.nanmax(np.where(valid, values, -np.inf), axis=0))
+        self.nulls += (~valid).sum(axis=0)
+        self.zeros += (values == 0).sum(axis=0)
+        for col, edges in self.bins.items():
+            column = values[:, self.columns.index(col)]
+            self.hist[col] += np.histogram(column[~np.isnan(column)], bins=edges)[0]
+
+    # Combines the count, mean and m2 of another set of rows with these
+    # (Chan et al.'s parallel form of Welford's method).
+    def combine(self, count, mean, m2):
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta**2 * self.count * count / total, 0)
+        self.count = total
+
+    # Adds the rows accumulated by another worker.
+    def merge(self, other):
+        assert(self.columns == other.columns), 'Statistics over different columns can\'t be merged'
+        self.combine(other.count, other.mean, other.m2)
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.nulls += other.nulls
+        self.zeros += other.zeros
+        for col in self.hist:
+            if col in other.hist:
+                self.hist[col] += other.hist[col]
+        self.games += other.games
+
+    # Summary table with a row per column.
+    def summary(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(np.where(self.count > 0, self.m2 / self.count, np.nan))
+        return pd.DataFrame({'column': self.columns,
+                             'count': self.count,
+                             'mean': np.where(self.count > 0, self.mean, np.nan),
+                             'std': std,
+                             'min': np.where(self.count > 0, self.min, np.nan),
+                             'max': np.where(self.count > 0, self.max, np.nan),
+                             'nulls': self.nulls,
+                             'zeros': self.zeros})
+
+    def save(self, path):
+        arrays = {'columns': np.array(self.columns, dtype=str),
+                  'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                  'min': self.min, 'max': self.max,
+                  'nulls': self.nulls, 'zeros': self.zeros,
+                  'games': np.array(self.games, dtype=str),
+                  'hist_columns': np.array(list(self.hist), dtype=str)}
+        for i, col in enumerate(self.hist):
+            arrays[f'edges_{i}'] = self.bins[col]
+            arrays[f'hist_{i}'] = self.hist[col]
+        with open(path+'.tmp', 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(path+'.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            stats = cls(data['columns'].tolist())
+            for field in ('count', 'mean', 'm2', 'min', 'max', 'nulls', 'zeros'):
+                setattr(stats, field, data[field])
+            stats.games = data['games'].tolist()
+            for i, col in enumerate(data['hist_columns'].tolist()):
+                stats.bins[col] = data[f'edges_{i}']
+                stats.hist[col] = data[f'hist_{i}']
+        return stats
+
+
+# Output backend that accumulates the statistics of the games it receives.
+#
+# Each worker saves its accumulator as a part, and finalize() merges the parts
+# into the season's statistics, {output_path}/{year}.stats.npz, with a readable
+# summary in {output_path}/{year}.stats.csv.
+class StatsBackend:
+    name = 'stats'
+
+    def __init__(self, config, year, part):
+        self.part_file = config.output_path+f'/{year}eve/parts/{self.name}/{part}.npz'
+        self.bins = config.stats_bins
+        self.stats = None
+
+    def write_game(self, game_id, df, actions=None, events=None):
+        df = schema.cast(df)
+        if self.stats is None:
+            self.stats = StreamingStats([col for col in df.columns if df[col].dtype.kind in 'biuf'],
+                                        bins=self.bins)
+        self.stats.update(df[self.stats.columns].to_numpy(dtype=np.float64))
+        self.stats.games.append(game_id)
+
+    def close(self):
+        if self.stats is None:
+            return
+        os.makedirs(os.path.dirname(self.part_file), exist_ok=True)
+        self.stats.save(self.part_file)
+        self.stats = None
+
+    # Merges the season's parts into the season's statistics and removes them.
+    #
+    # Accumulated rows can't be taken back out, so the statistics of games that
+    # are built again can't be updated in place. New games are added to the
+    # season's statistics, and a rebuild of every game of the season (also with
+    # other feature columns) replaces them, like the other season files. A
+    # rebuild of only part of the season is an error. Within the parts, the
+    # first build of a game is kept.
+    @classmethod
+    def finalize(cls, config, year, vocab):
+        part_path = config.output_path+f'/{year}eve/parts/{cls.name}'
+        parts = sorted(glob.glob(part_path+'/*.npz'))
+        if not parts:
+            return
+        season_file = config.output_path+f'/{year}.stats.npz'
+        stats = None
+        for part in parts:
+            part_stats = StreamingStats.load(part)
+            if stats is None:
+                stats = part_stats
+            else:
+                counted = set(part_stats.games) & set(stats.games)
+                if len(counted) == len(part_stats.games):
+                    continue
+                if counted:
+                    warnings.warn(f'{len(counted)} game(s) in {part} are counted twice in the {year} stats')
+                stats.merge(part_stats)
+        if os.path.isfile(season_file):
+            old = StreamingStats.load(season_file)
+            rebuilt = set(stats.games)
+            kept = [game for game in old.games if not game in rebuilt]
+            if len(kept) == len(old.games) and old.columns == stats.columns:
+                old.merge(stats)
+                stats = old
+            else:
+                assert(not kept), (f'{season_file} can\'t be updated with games that are already in it or with other '
+                                   f'columns unless the whole season is rebuilt, {len(kept)} of its games were not. '
+                                   f'Delete {season_file} and rebuild the {year} season.')
+        stats.save(season_file)
+        stats.summary().to_csv(config.output_path+f'/{year}.stats.csv', index=False)
+        for part in parts:
+            os.remove(part)
+        try:
+            os.removedirs(part_path)
+        except OSError:
+            pass
+
+
+# Loads the statistics of one or more seasons, merged together.
+#
+# Input:
+#  - output_path (str): output path from the configuration
+#  - years (int or iterable): seasons to be loaded
+#
+# Output:
+#  StreamingStats, use .summary() for a table of mean, std, min and max
+def load_stats(output_path, years):
+    years = [years] if isinstance(years, int) else list(years)
+    stats = StreamingStats.load(output_path+f'/{years[0]}.stats.npz')
+    for year in years[1:]:
+        stats.merge(StreamingStats.load(output_path+f'/{year}.stats.npz'))
+    return stats
@@ -0,0 +1,187 @@
+# This file defines the actions and rewards of the transitions dataset.
+#
+# Every state recorded by the processor is the state an action was taken in.
+# The transitions format (see TransitionBackend in datasets/backends.py) stores
+# the action and reward of each state next to its features, so a season can be
+# used directly as an offline replay buffer of (s, a, r, s', done) transitions:
+#
+#  - s:     the state's features
+#  - a:     (event, advance), the event type id and the runner advancement code
+#  - r:     runs scored by the team at bat during the action
+#  - s':    the next state recorded in the game
+#  - done:  True on the last state of a game
+#
+# The event type ids index event_types below. The runner advancement code packs
+# the outcome of the batter and each runner into 3 bits, the batter in the low
+# bits followed by the runners on 1B, 2B and 3B:
+#
+#  - 0: no runner on the base, or the batter is still at bat
+#  - 1, 2, 3: safe at 1B, 2B or 3B
+#  - 4: scored
+#  - 5: out
+#
+# e.g. a single that scores the runner from 2B is 1 + 4*8**2 = 257.
+
+# External imports
+import json
+import numpy as np
+
+# Event types, in the order of their ids. Substitutions and position switches
+# are recorded as states too, with event type 0.
+event_types = ['Substitution',
+               'Single Fielder Out',
+               'Force Out',
+               'Out',
+               'Ground Ball Double Play',
+               'Line Out Double Play',
+               'Double Play',
+               'Ground Ball Triple Play',
+               'Line Out Triple Play',
+               'Triple Play',
+               'Catcher Interference',
+               'Single',
+               'Double',
+               'Triple',
+               'Ground Rule Double',
+               'Error',
+               'Fielders Choice',
+               'Error on Foul Fly',
+               'Homerun',
+               'Hit by Pitch',
+               'Strikeout',
+               'Strikeout w/ Stolen Base',
+               'Strikeout w/ Caught Stealing',
+               'Strikeout w/ Other Advancement',
+               'Strikeout w/ Pickoff',
+               'Strikeout w/ Pickoff Off base',
+               'Strikeout w/ Pass Ball',
+               'Strikeout w/ Wild Pitch',
+               'Strikeout w/ Error',
+               'Strikeout w/ Defense Indifference',
+               'No Play',
+               'Walk',
+               'Walk w/ Stolen Base',
+               'Walk w/ Caught Stealing',
+               'Walk w/ Pickoff',
+               'Walk w/ Pickoff Off Base',
+               'Walk w/ Passed Ball',
+               'Walk w/ Wild Pitch',
+               'Walk w/ Error',
+               'Walk w/ Defense Indifference',
+               'Walk w/ Other Advancement',
+               'Balk',
+               'Caught Stealing',
+               'Defensive Indifference',
+               'Other Advancement',
+               'Passed Ball',
+               'Wild Pitch',
+               'Pickoff',
+               'Picked Off, Off Base',
+               'Stolen Base']
+
+event_ids = {event: i for i, event in enumerate(event_types)}
+
+# Columns the action and reward are stored in
+action_cols = ['event', 'advance', 'reward']
+
+# Action of a state without a play
+no_action = (0, 0, 0)
+
+# Builds the action of a play.
+#
+# Input:
+#  - play_str (str): play description from the processor
+#  - runners (list): runner ids on 1B, 2B and 3B before the play, or None
+#  - next_runners (list): runner ids on 1B, 2B and 3B after the play, or None
+#  - batter (str): batter id
+#  - scored (list): ids of the players that scored on the play
+#  - batter_done (bool): True if the batter's plate appearance ended
+#
+# Output:
+#  (event type id, runner advancement code, runs scored)
+def encode_action(play_str, runners, next_runners, batter, scored, batter_done):
+    assert(play_str in event_ids), f'Unknown event type {play_str}'
+    advance = 0
+    for i, runner in enumerate([batter]+runners):
+        if not runner:
+            continue
+        if runner in next_runners:
+            outcome = next_runners.index(runner)+1
+        elif runner in scored:
+            outcome = 4
+        elif i or batter_done:
+            outcome = 5
+        else:
+            outcome = 0
+        advance |= outcome << 3*i
+    return event_ids[play_str], advance, len(scored)
+
+# Splits runner advancement codes into the outcome of the batter and each
+# runner.
+#
+# Output:
+#  int8 array of shape [n, 4], columns for the batter, 1B, 2B and 3B
+def decode_advance(advance):
+    advance = np.asarray(advance, dtype=np.int16)
+    return np.stack([(advance >> 3*i) & 7 for i in range(4)], axis=-1).astype(np.int8)
+
+
+# Memory-mapped replay buffer over a season written by the transitions format.
+#
+# Nothing is read until it is sliced, so a buffer can be sampled from without
+# loading the season. s' is not stored, it is the next row of the states.
+class ReplayBuffer:
+    def __init__(self, path):
+        files = replay_files(path)
+        with open(files['schema'], 'r') as file:
+            sidecar = json.load(file)
+        self.columns = sidecar['columns']
+        self.event_types = sidecar['event_types']
+        self.states = np.load(files['states'], mmap_mode='r')
+        self.actions = np.load(files['actions'], mmap_mode='r')
+        self.rewards = np.load(files['rewards'], mmap_mode='r')
+        self.dones = np.load(files['dones'], mmap_mode='r')
+        self.game_ids = np.load(files['game_ids'], mmap_mode='r')
+
+    def __len__(self):
+        return self.states.shape[0]
+
+    # Reads a batch of transitions.
+    #
+    # Input:
+    #  - rows (ndarray): rows of the transitions
+    #
+    # Output:
+    #  (s, a, r, s', done), s' is s on the last state of a game
+    def batch(self, rows):
+        rows = np.asarray(rows)
+        dones = self.dones[rows]
+        next_rows = np.where(dones, rows, np.minimum(rows+1, len(self)-1))
+        return self.states[rows], self.actions[rows], self.rewards[rows], self.states[next_rows], dones
+
+    # Samples a batch of transitions uniformly.
+    #
+    # Input:
+    #  - batch_size (int): transitions per batch
+    #  - rng (Generator): optional, random generator
+    def sample(self, batch_size, rng=None):
+        rng = rng or np.random.default_rng()
+        return self.batch(np.sort(rng.integers(0, len(self), size=batch_size)))
+
+
+# Paths of the files that make up a season's transitions, {prefix}.replay.json.
+#  - states:   float32 [n, n_features] features of every state
+#  - actions:  int16 [n, 2] event type id and runner advancement code
+#  - rewards:  int8 [n] runs scored by the team at bat
+#  - dones:    bool [n] True on the last state of a game
+#  - game_ids: str [n] game of every state
+#  - schema:   json sidecar with the feature columns and event types, written
+#              last so a season is only visible once its files are complete
+def replay_files(path):
+    prefix = path[:-len('.replay.json')]
+    return {'states': prefix+'.replay.states.npy',
+            'actions': prefix+'.replay.actions.npy',
+            'rewards': prefix+'.replay.rewards.npy',
+            'dones': prefix+'.replay.dones.npy',
+            'game_ids': prefix+'.replay.game_ids.npy',
+            'schema': path}
@@ -0,0 +1,113 @@
+# This file defines the player vocabulary of the columnar datasets.
+#
+# The binary output formats store the batter and pitcher as int32 codes instead
+# of Retrosheet ids. The codes come from one vocabulary shared by every season
+# in the output path, {output_path}/players.csv, so a code means the same player
+# in every season and can be used directly as an embedding index.
+#
+# The vocabulary only ever grows. New players are appended, in sorted order,
+# when a season is merged, so the codes in seasons that are already written
+# stay valid. Code 0 is reserved for no player.
+#
+# Seasons can be merged at the same time by several processes or nodes, so an
+# update holds an exclusive lock file while it reloads, extends and saves the
+# vocabulary (the same O_EXCL claim as processors/manifest.py).
+
+# External imports
+from contextlib import contextmanager
+import numpy as np
+import os
+import pandas as pd
+import socket
+import time
+
+# Columns holding player ids
+player_cols = ['batter', 'pitcher']
+
+# Seconds after which a lock is assumed to be left behind by a dead process
+lock_timeout = 60
+
+
+class PlayerVocab:
+    def __init__(self, output_path):
+        self.path = output_path+'/players.csv'
+        self.load()
+
+    def load(self):
+        if os.path.isfile(self.path):
+            self.ids = pd.read_csv(self.path, keep_default_na=False, dtype={'id': str})['id'].tolist()
+        else:
+            self.ids = ['']
+        self.index = pd.Index(self.ids)
+
+    # Holds the vocabulary's lock file.
+    @contextmanager
+    def locked(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock = self.path+'.lock'
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock).st_mtime > lock_timeout:
+                        print(f'Removing stale lock {lock}')
+                        os.remove(lock)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.1)
+        os.close(fd)
+        try:
+            yield
+        finally:
+            os.remove(lock)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Adds any players that aren't in the vocabulary yet and saves it.
+    #
+    # Input:
+    #  - ids (iterable): Retrosheet player ids
+    #
+    # Output:
+    #  None
+    def update(self, ids):
+        ids = set(ids)
+        if not ids - set(self.ids):
+            return
+        with self.locked():
+            # Another process may have added players since the last load
+            self.load()
+            new_ids = sorted(ids - set(self.ids))
+            if not new_ids:
+                return
+            self.ids += new_ids
+            self.index = pd.Index(self.ids)
+            df = pd.DataFrame({'code': np.arange(len(self.ids)), 'id': self.ids})
+            tmp = self.path+f'.{socket.gethostname()}-{os.getpid()}.tmp'
+            df.to_csv(tmp, index=False)
+            os.replace(tmp, self.path)
+
+    # Replaces the player id columns of a dataframe with their codes, adding
+    # new players to the vocabulary.
+    def encode(self, df):
+        cols = [col for col in player_cols if col in df.columns and df[col].dtype.kind != 'i']
+        if not cols:
+            return df
+        self.update(np.unique(np.concatenate([df[col].to_numpy().astype(str) for col in cols])))
+        df = df.copy()
+        for col in cols:
+            df[col] = self.index.get_indexer(df[col].to_numpy().astype(str)).astype(np.int32)
+        return df
+
+    # Replaces the player code columns of a dataframe with the ids.
+    def decode(self, df):
+        df = df.copy()
+        ids = np.array(self.ids)
+        for col in player_cols:
+            if col in df.columns:
+                df[col] = ids[df[col].to_numpy()]
+        return df
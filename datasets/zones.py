@@ -0,0 +1,57 @@
+# This file defines the zone maps of the columnar datasets.
+#
+# A zone map holds the min and max of the commonly filtered state columns for
+# every game of a season, {output_path}/{year}.zones.csv. Queries compare their
+# predicates against the zone map to skip the games, and whole seasons, that
+# can't contain a matching state (see datasets/query.py).
+
+# External imports
+import numpy as np
+import os
+import pandas as pd
+
+# State columns with a zone map
+zone_cols = ['Inning', 'Outs', 'Away', 'Home', '1B', '2B', '3B']
+
+# Columns derived from the state columns, which can also be filtered on.
+#  - diff: home score minus away score
+#  - margin: absolute run differential
+#  - runners: number of runners on base
+derived_cols = {'diff': lambda df: df['Home'].astype(np.int16) - df['Away'].astype(np.int16),
+                'margin': lambda df: (df['Home'].astype(np.int16) - df['Away'].astype(np.int16)).abs(),
+                'runners': lambda df: df['1B'].astype(np.int8) + df['2B'].astype(np.int8) + df['3B'].astype(np.int8)}
+
+# State columns each derived column is computed from
+derived_deps = {'diff': ['Away', 'Home'],
+                'margin': ['Away', 'Home'],
+                'runners': ['1B', '2B', '3B']}
+
+# Adds the derived columns that can be computed from the dataframe's columns.
+def add_derived(df, cols=None):
+    for col, fn in derived_cols.items():
+        if (cols is None or col in cols) and all(dep in df.columns for dep in derived_deps[col]):
+            df[col] = fn(df)
+    return df
+
+# Builds the zone map of a season's states.
+#
+# Input:
+#  - df (Dataframe): states of a season, with the game_id column
+#
+# Output:
+#  Dataframe with the game_id and a min_{col} and max_{col} column per zone column
+def build(df):
+    cols = [col for col in zone_cols if col in df.columns]
+    df = add_derived(df[['game_id']+cols].copy())
+    cols = [col for col in cols+list(derived_cols) if col in df.columns]
+    groups = df.groupby('game_id', sort=False)[cols]
+    lows = groups.min().astype(np.int16).add_prefix('min_')
+    highs = groups.max().astype(np.int16).add_prefix('max_')
+    return pd.concat([lows, highs], axis=1).reset_index()
+
+def save(df, path):
+    build(df).to_csv(path+'.tmp', index=False)
+    os.replace(path+'.tmp', path)
+
+def load(path):
+    return pd.read_csv(path, dtype={'game_id': str}) if os.path.isfile(path) else None
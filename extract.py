@@ -0,0 +1,55 @@
+# External imports
+import argparse
+import re
+import time
+import yaml
+
+
+# Internal imports
+from configuration import Configuration
+from datasets.query import extract
+
+# Parse input arguments
+#
+# Example: states from the 9th inning on with the score within two runs
+#   python extract.py config.yaml -y 2000-2020 -w 'Inning>=9' -w 'margin<=2' -o close-late.csv
+parser = argparse.ArgumentParser()
+parser.add_argument('config')
+parser.add_argument('-y', '--year')
+parser.add_argument('-w', '--where', action='append', default=[]) # predicate, e.g. 'Outs==2', may be repeated
+parser.add_argument('-c', '--columns', default='') # comma separated columns to output, default all
+parser.add_argument('-o', '--output', default='extract.csv') # .csv or .parquet
+parser.add_argument('--player_ids', action='store_true') # output Retrosheet ids instead of codes
+args = parser.parse_args()
+
+# Get config
+if not args.config:
+    raise Exception('Config arguement not found.')
+with open(args.config, 'r') as yamlfile:
+    config = yaml.load(yamlfile, Loader=yaml.FullLoader)
+
+# Get years
+if not args.year:
+    raise Exception('Year arguement not found.')
+# years must be between 2000-2023
+year_ptrn = re.compile(r'(20[0-1]\d|202[0-4])')
+input_years = re.findall(year_ptrn, args.year)
+if len(input_years) == 2:
+    years = range(int(input_years[0]), int(input_years[1])+1)
+elif len(input_years) == 1:
+    years = range(int(input_years[0]), int(input_years[0])+1)
+else:
+    raise Exception(f'{args.year} pattern is not recognized.')
+
+start = time.time()
+columns = [col for col in args.columns.split(',') if col]
+df, report = extract(config.output_path, years, args.where, columns=columns or None,
+                                                            player_ids=args.player_ids)
+if args.output.endswith('.parquet'):
+    df.to_parquet(args.output, index=False)
+else:
+    df.to_csv(args.output, index=False)
+print(f"Read {report['games']} game(s) in {report['seasons']} season(s), "
+      f"skipped {report['games_skipped']} game(s) and {report['seasons_skipped']} season(s)")
+print(f"{len(df)} of {report['rows_read']} state(s) read matched, see {args.output}")
+print(f'--> Execution time: {time.time() - start}')
@@ -1,7 +1,6 @@
 # External imports
 import argparse
 import datetime
-from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -12,7 +11,8 @@ import yaml
 
 # Internal imports
 from configuration import Configuration
-from processors.processor import Processor
+from datasets import backends
+from processors import manifest, scheduler
 
 # Parse input arguments
 parser = argparse.ArgumentParser()
@@ -21,6 +21,10 @@ parser.add_argument('-y', '--year')
 parser.add_argument('-g', '--game')
 parser.add_argument('-t', '--team')
 parser.add_argument('-j', '--jobs', default=1)
+parser.add_argument('--progress', action='store_true') # show one live progress line
+parser.add_argument('--by_team', action='store_true') # one task per event file instead of per game
+parser.add_argument('--manifest', action='store_true') # share tasks with other nodes through output_path
+parser.add_argument('--lease', default=600) # seconds before a dead node's task is reclaimed
 args = parser.parse_args()
 
 # Get config
@@ -43,44 +47,30 @@ else:
     raise Exception(f'{args.year} pattern is not recognized.')
 
 start = time.time()
+# Queue the tasks for every year up front and run them on one worker pool.
+#
+# If an individual game is specified in the command line, then only process it.
+# Else, if an individual team is specified, then only process its games.
+# Else, process all games for all teams.
+if args.game and not int(args.game[3:7]) in years:
+    print(f'Warning: {args.game} is not in {args.year}')
+tasks = scheduler.build_tasks(config, years, team_id=args.team or '', 
+                                            game_id=args.game or '',
+                                            by_game=not args.by_team)
+if args.manifest:
+    task_manifest = manifest.run(config, tasks, int(args.jobs), scheduler.run_task, lease=int(args.lease),
+                                                                                    progress=args.progress)
+else:
+    scheduler.run(config, tasks, int(args.jobs), progress=args.progress)
+
+# Merge each season's parts into the per-season output files.
+# With a manifest, only one node merges each season.
+finalize_season = lambda config, task, proc_kwargs: backends.finalize(config, task.year)
 for year in years:
-    # Get list of games for the given year
-    teams_df = pd.read_csv(config.input_path+f'/{year}eve'+f'/TEAM{year}', header=None)
-    teams_df.columns = ['id', 'league', 'city', 'name']
-    # If an individual game is specified in the command line, then process it.
-    if args.game:
-        # Initialize processor
-        proc = Processor(config)
-        # Validate the given game happened during the current year
-        if year != int(args.game[3:7]):
-            print(f'Warning: {args.agame} is not in {year}')
-            continue
-        team = teams_df.loc[teams_df['id'] == args.game[:3]].iloc[0]
-        print(f'PROCESSING {args.game}')
-        proc.process_team(year, team['id'], team['league'], args.game)
-    # Else, if an indiviual game is specified in the command line, then process it.
-    elif args.team:
-        # Initialize processor
-        proc = Processor(config)
-        team = teams_df.loc[teams_df['id'] == args.team].iloc[0]
-        print(f"PROCESSING {year} {team['city']} {team['name']}")
-        proc.process_team(year, team['id'], team['league'])
-    # Else, process all games for all teams for the year.
+    if args.manifest:
+        manifest.run_step(task_manifest, config, scheduler.Task(year, 'season', '', f'{year} season', '', 0),
+                          finalize_season)
     else:
-        # Define parameters
-        njobs = int(args.jobs)
-        nteams = len(teams_df)
-        # Initialize processors for each team
-        #procs = [Processor(config)] * nteams
-        # Define wrapper function to log the parallel execution
-        def proc_wrapper(config, team_idx):
-            team = teams_df.iloc[team_idx]
-            print(f"PROCESSING {year} {team['city']} {team['name']}")
-            proc = Processor(config)
-            #procs[i].process_team(year, team['id'], team['league'])
-            proc.process_team(year, team['id'], team['league'])
-        # Launch parallel jobs
-        Parallel(n_jobs=njobs)(delayed(proc_wrapper)(config, idx) for idx in range(nteams))
-
-    print()
+        backends.finalize(config, year)
+print()
 print(f'--> Execution time: {time.time() - start}')
@@ -6,11 +6,16 @@ import os
 import pandas as pd
 import sys
 
+# Internal imports
+from datasets.labels import add_labels
+from datasets.transitions import no_action
+from processors.reference import park_factors
+
 # Adding top level project directory
 sys.path.insert(0, '../')
 
 class GameState:
-    def __init__(self, game_id):
+    def __init__(self, game_id, matchups=None):
         # Id
         self.id = game_id
         self.date = None
@@ -24,9 +29,15 @@ class GameState:
         self.batter = ''
         self.count = [] # [balls, strikes]
         self.past = None # History of game features
+        self.actions = [] # Action taken in each past state, see datasets/transitions.py
+        self.events = [] # Plays made from the past states, see EventBackend in datasets/backends.py
         # General game info
         self.info = {}
         self.const_features = None
+        # Batter vs pitcher features, see players/matchups.py
+        self.matchups = matchups
+        # Batter's stats against each pitcher in this game, (batter, pitcher) -> stats
+        self.matchup_stats = {}
 
     def get_state_features(self):
         vector = []
@@ -70,7 +81,7 @@ class GameState:
     def get_parkfactor(self):
         assert(self.teams[1] and self.date)
         name = self.teams[1].name
-        parks_df = pd.read_csv('./data/parkfactors.csv')
+        parks_df = park_factors()
         return parks_df.loc[(parks_df['Season'] == self.date.year) & (parks_df['Team'] == name)]['Basic'].to_numpy()[0]
 
     def get_const_features(self):
@@ -88,7 +99,7 @@ class GameState:
             #
             # Temperature
             vector.append(int(self.info['temp']))
-            columns.append('windspeed')
+            columns.append('temp')
             #
             # Wind direction
             wind_directions = ['fromcf', 'fromlf', 'fromrf', 'ltor', 'rtol', 'tocf', 'tolf', 'torf']
@@ -134,54 +145,59 @@ class GameState:
         field_team_feats = self.teams[not self.is_bot].featurize()
         field_team_feats = field_team_feats.rename(lambda s: 'F_'+s)
         # Append the feature types into a single feature vector
-        return pd.concat([state_feats, const_feats, atbat_team_feats, field_team_feats])
+        feats = [state_feats, const_feats]
+        if self.matchups:
+            feats.append(self.matchups.featurize(self.id, self.batter, self.teams[not self.is_bot].pitcher))
+        return pd.concat(feats + [atbat_team_feats, field_team_feats])
 
-    def checkpoint(self):
+    # Records the current state.
+    #
+    # Input:
+    #  - action (tuple): optional, (event type id, runner advancement code,
+    #                    runs scored) of the play made from this state, no
+    #                    play for substitutions
+    #  - event (dict): optional, event table row of the play
+    def checkpoint(self, action=no_action, event=None):
         feats = self.featurize()
         if self.past is None:
             self.past = []
         self.past.append(feats)
+        self.actions.append(action)
+        if event is not None:
+            self.events.append({'state': len(self.past)-1, **event})
 
-    def add_result(self, final):
-        # Add result to the past dataframe
-        # True if home team won
-        # final (score) = [away, home]
-        rows = self.df.shape[0]
-        away_final = pd.Series(np.ones(rows), dtype=np.float64) * final[0]
-        home_final = pd.Series(np.ones(rows), dtype=np.float64) * final[1]
-        self.df['away_final'] = away_final
-        self.df['home_final'] = home_final
-
-    def end(self, final, output, save_state=True, 
-                                 save_stats=False, 
-                                 verify_stats_path=False, 
-                                 overwrite=False):
+    def end(self, final, backends=(), save_state=True,
+                                      stats_shard=None,
+                                      verifier=None,
+                                      writer=None):
         #
-        # Build dataframe from list of series
-        self.df = pd.DataFrame(self.past)
-
+        # Record the accumulated stats to be verified against retrosplits data.
+        if verifier:
+            verifier.record_game(self)
         #
-        # Verify that the accumulated stats agree with retrosplits data.
-        if verify_stats_path:
-            for team in self.teams:
-                if not team.verify_game_stats(self.id, verify_stats_path):
-                    assert(False)
+        # Save the player stats to the worker's shard of the stats store
+        if stats_shard:
+            stats_shard.add_game(self)
         #
-        # Save the game state
+        # Save the game state, on the background writer if there is one.
         if save_state:
-            # Add the final score and save the game features to a csv file.
-            self.add_result(final)
-            self.save(output)
-        #
-        # Save the player stats
-        if save_stats:
-            self.teams[0].save_stats(self.id, self.date, overwrite=overwrite)
-            self.teams[1].save_stats(self.id, self.date, overwrite=overwrite)
+            if writer:
+                writer.submit(self.write, final, backends)
+            else:
+                self.write(final, backends)
 
-    def save(self, path):
-        if not os.path.exists(path):
-            os.makedirs(path)
-        self.df.to_csv(path+f'/{self.id}.csv', index=False)
+    def write(self, final, backends):
+        #
+        # Build dataframe from list of series
+        self.df = pd.DataFrame(self.past)
+        #
+        # Add the labels and hand the game features, the actions taken in each
+        # state and the plays to each output backend.
+        actions = np.array(self.actions, dtype=np.int16).reshape(-1, 3)
+        add_labels(self.df, actions, final)
+        events = pd.DataFrame(self.events)
+        for backend in backends:
+            backend.write_game(self.id, self.df, actions, events)
 
     def __str__(self):
         # Get batter and pitcher
@@ -0,0 +1,79 @@
+# This file defines the pitcher fatigue features.
+#
+# The pitching stats over the last N games say nothing about how recently those
+# games were. The fatigue features measure a pitcher's recent workload in
+# calendar days, from his appearances before the current game:
+#
+#  * Rest       - Days since his last appearance, 0 for the second game of a
+#                 doubleheader, capped at rest_cap
+#  * B2B        - Consecutive days he appeared on, ending the day before
+#  * PITCH{n}d  - Pitches thrown in the last n days
+#  * TBF{n}d    - Batters faced in the last n days
+#
+# Each pitcher's appearances are indexed by day once per process, with their
+# rows in his stats file and running totals of the pitches and batters faced.
+# The appearances before a game are then found with a binary search over the
+# rows, and each feature is a binary search over the days.
+
+# External imports
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Trailing windows in days, and the most days of rest counted
+windows = (1, 3, 7)
+rest_cap = 30
+
+fatigue_stats = (['Rest', 'B2B'] +
+                 [f'{stat}{n}d' for stat in ('PITCH', 'TBF') for n in windows])
+
+
+class AppearanceIndex:
+    # Input:
+    #  - stats_df (Dataframe): player's day-by-day stats, sorted by game
+    def __init__(self, stats_df):
+        appeared = stats_df['P_G'].fillna(0).to_numpy() > 0
+        # Rows of the appearances in the stats file, and their day numbers,
+        # both sorted since the store is
+        self.rows = np.flatnonzero(appeared)
+        self.days = pd.to_datetime(stats_df['date'][appeared]).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        # Running totals with a leading zero, totals over appearances [lo, hi)
+        # are total[hi] - total[lo]
+        self.totals = {stat: np.r_[0, np.cumsum(stats_df['P_'+stat].fillna(0).to_numpy()[appeared])]
+                       for stat in ('PITCH', 'TBF')}
+
+    # Input:
+    #  - present (int): row of the current game in the stats file, or the row
+    #                   it would be at
+    #  - game_id (str): current game id
+    #
+    # Output:
+    #  dict of fatigue stat -> value
+    def featurize(self, present, game_id):
+        today = np.datetime64(f'{game_id[3:7]}-{game_id[7:9]}-{game_id[9:11]}', 'D').astype(np.int64)
+        # Appearances before the game are [0, n)
+        n = np.searchsorted(self.rows, present, side='left')
+        days = self.days[:n]
+        # Appearances on or after a day
+        since = lambda day: n - np.searchsorted(days, day, side='left')
+        feats = {}
+        feats['Rest'] = min(today - days[-1], rest_cap) if n else rest_cap
+        # Walk back one day at a time while he pitched the day before
+        b2b = 0
+        while since(today - b2b - 1) > since(today - b2b):
+            b2b += 1
+        feats['B2B'] = b2b
+        for w in windows:
+            lo = np.searchsorted(days, today - w, side='left')
+            for stat, total in self.totals.items():
+                feats[f'{stat}{w}d'] = total[n] - total[lo]
+        return feats
+
+
+# Each pitcher's index is built once per process
+#
+# Input:
+#  - path (str): path to the pitcher's stats file
+@lru_cache(maxsize=None)
+def load_index(path):
+    return AppearanceIndex(pd.read_csv(path, usecols=['date', 'P_G', 'P_PITCH', 'P_TBF']))
@@ -0,0 +1,119 @@
+# This file defines the batter vs pitcher matchup features.
+#
+# The matchup file of the stats store (see players/store.py) has a row of the
+# batter's counting stats against the pitcher for every game they faced each
+# other in. MatchupIndex sorts it by batter, pitcher and game and keeps the
+# running totals of every stat, so the totals of a pair over any run of games
+# are the difference of two rows. Finding the rows is a binary search for the
+# pair and another for the games, so a lookup never scans the file.
+#
+# Features are named M{n}_{stat}, the batter's stats against the pitcher over
+# the n seasons up to and including the current one, before the current game.
+# M0_{stat} covers every past season.
+
+# External imports
+from functools import lru_cache
+import numpy as np
+import os
+import pandas as pd
+
+# Internal imports
+from players.store import matchup_cols, matchup_path, matchup_stats
+from processors.reference import woba_weights
+
+# Counting stats that can be used as features, and the derived stats
+counting_feats = ['PA', 'AB', 'H', 'HR', 'BB', 'SO']
+derived_feats = {'K%':   lambda x: x['SO']/x['PA'] if x['PA'] else 0,
+                 'BB%':  lambda x: x['BB']/x['PA'] if x['PA'] else 0,
+                 'AVG':  lambda x: x['H']/x['AB'] if x['AB'] else 0,
+                 'wOBA': lambda x: (x['wTB']/(x['AB']+x['BB']-x['IBB']+x['SF']+x['HP'])
+                                    if (x['AB']+x['BB']-x['IBB']+x['SF']+x['HP']) else 0)}
+feats = counting_feats + list(derived_feats.keys())
+
+# Game id to a number that orders games by date and game number
+order_of = lambda game_id: int(game_id[3:])
+
+
+class MatchupIndex:
+    def __init__(self, path=matchup_path):
+        assert(os.path.isfile(path)), f'{path} not found, the stats must be built before the matchup features'
+        df = pd.read_csv(path)
+        order = np.array([order_of(key) for key in df['game.key']], dtype=np.int64)
+        pairs = (df['batter'] + ',' + df['pitcher']).to_numpy().astype(str)
+        sort = np.lexsort((order, pairs))
+        self.pairs = pairs[sort]
+        self.order = order[sort]
+        values = df[matchup_cols].to_numpy(dtype=np.float64)[sort]
+        # Weighted total bases of each row, with the weights of its season
+        weights = woba_weights().set_index('Season')
+        w = weights.reindex(self.order // 100000)
+        singles = values[:, matchup_stats.index('H')] - values[:, [matchup_stats.index(s) for s in ('2B', '3B', 'HR', 'HR4')]].sum(axis=1)
+        col = lambda stat: values[:, matchup_stats.index(stat)]
+        wtb = (w['wBB'].to_numpy()*col('BB') + w['wHBP'].to_numpy()*col('HP') + w['w1B'].to_numpy()*singles +
+               w['w2B'].to_numpy()*col('2B') + w['w3B'].to_numpy()*col('3B') + w['wHR'].to_numpy()*(col('HR')+col('HR4')))
+        # Running totals with a leading row of zeros, the totals of rows
+        # [lo, hi) are totals[hi] - totals[lo]
+        self.columns = matchup_stats + ['wTB']
+        self.totals = np.vstack([np.zeros((1, len(self.columns))),
+                                 np.cumsum(np.column_stack([values, np.nan_to_num(wtb)]), axis=0)])
+
+    # Sums the batter's stats against the pitcher over a run of games.
+    #
+    # Input:
+    #  - batter (str): batter id
+    #  - pitcher (str): pitcher id
+    #  - start (int): first game order included, see order_of()
+    #  - end (int): first game order excluded
+    #
+    # Output:
+    #  dict of stat -> total
+    def lookup(self, batter, pitcher, start, end):
+        pair = f'{batter},{pitcher}'
+        lo = np.searchsorted(self.pairs, pair, side='left')
+        hi = np.searchsorted(self.pairs, pair, side='right')
+        lo, hi = lo + np.searchsorted(self.order[lo:hi], [start, end], side='left')
+        return dict(zip(self.columns, self.totals[hi] - self.totals[lo]))
+
+
+# The index is built once per process
+@lru_cache(maxsize=None)
+def load_index():
+    return MatchupIndex()
+
+
+class MatchupFeatures:
+    # Input:
+    #  - stat_features (list): features of each window, see feats
+    #  - seasons (list): windows in seasons, 0 for every past season
+    def __init__(self, stat_features, seasons=(0,)):
+        for stat in stat_features:
+            assert(stat in feats), f'Unknown matchup feature {stat}'
+        self.stat_features = list(stat_features)
+        self.seasons = list(seasons)
+        self.index = load_index()
+        # Features of the pairs seen in the current game
+        self.game_id = None
+        self.cache = {}
+
+    # Input:
+    #  - game_id (str): current game id, only games before it are counted
+    #  - batter (str): batter id
+    #  - pitcher (str): pitcher id
+    #
+    # Output:
+    #  Series of the matchup features
+    def featurize(self, game_id, batter, pitcher):
+        if game_id != self.game_id:
+            self.game_id = game_id
+            self.cache = {}
+        if not (batter, pitcher) in self.cache:
+            end = order_of(game_id)
+            feat_dict = {}
+            for n in self.seasons:
+                start = (end // 100000 - n + 1) * 100000 if n else 0
+                stats = (self.index.lookup(batter, pitcher, start, end) if batter and pitcher else
+                         dict.fromkeys(self.index.columns, 0))
+                for stat in self.stat_features:
+                    feat_dict[f'M{n}_{stat}'] = derived_feats[stat](stats) if stat in derived_feats else stats[stat]
+            self.cache[(batter, pitcher)] = pd.Series(feat_dict, dtype=np.float64)
+        return self.cache[(batter, pitcher)]
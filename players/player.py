@@ -1,6 +1,7 @@
 # This file defines the player object
 
 # Internal imports
+from players.splits import batting_split_stats, pitching_split_stats, sides
 from players.stats.batting import BattingStats
 from players.stats.pitching import PitchingStats
 
@@ -93,34 +94,28 @@ class Player:
                 self.fielding_features = self.fielding.featurize()
             return self.fielding_features
 
-    def save_stats(self, game_id, game_date, overwrite=False):
-        player_file = f'./data/players-daybyday/{self.id}.csv'
+    # Row of the player's counting stats for the game in the day-by-day stats
+    # store (see players/store.py). Stats for facets the player didn't
+    # appear in are left empty.
+    def stats_row(self, game_id, game_date):
         cols = ['B_'+bstat for bstat in BattingStats.counting_stats]
         cols += ['P_'+pstat for pstat in PitchingStats.counting_stats]
+        cols += [f'B_v{side}_{bstat}' for side in sides for bstat in batting_split_stats]
+        cols += [f'P_v{side}_{pstat}' for side in sides for pstat in pitching_split_stats]
         cols += ['game.key', 'date']
-        # Open the player's day by day stat df if it exists, else create it
-        df = (
-              pd.read_csv(player_file)
-              if os.path.isfile(player_file)
-              else pd.DataFrame(columns=cols)
-        )
-        # Skip if overwrite is not enabled and game already exists
-        # Else, remove the old row.
-        if any(df['game.key'] == game_id):
-            if overwrite:
-                df.drop(df['game.key'] == game_id, inplace=True)
-            else:
-                return
-        # Else, add the row for the game in the dataframe and write the csv out to disk.
         row = dict.fromkeys(cols)
         row['game.key'] = game_id
         row['date'] = game_date
         if self.batting:
             for stat in BattingStats.counting_stats:
                 row['B_'+stat] = self.batting.in_game_stats[stat]
+            for side in sides:
+                for stat in batting_split_stats:
+                    row[f'B_v{side}_{stat}'] = self.batting.in_game_splits[side][stat]
         if self.pitching:
             for stat in PitchingStats.counting_stats:
                 row['P_'+stat] = self.pitching.in_game_stats[stat]
-        df.loc[len(df.index)] = pd.Series(row)
-        df.sort_values(by='game.key', key=lambda col: [int(x[3:]) for x in col], inplace=True, ignore_index=True)
-        df.to_csv(player_file, index=False)
+            for side in sides:
+                for stat in pitching_split_stats:
+                    row[f'P_v{side}_{stat}'] = self.pitching.in_game_splits[side][stat]
+        return row
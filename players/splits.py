@@ -0,0 +1,67 @@
+# This file defines the platoon splits of the player stats.
+#
+# Batters' stats are split by the throwing hand of the pitcher they faced, and
+# pitchers' stats by the side the batter hit from. Switch hitters hit from the
+# side opposite the pitcher's hand. The hands come from the Retrosheet roster
+# files (see processors/reference.py).
+#
+# The splits are accumulated during the stats pass alongside the counting
+# stats and stored as extra columns of the day-by-day stats store, e.g. B_vL_PA
+# for a batter's plate appearances against left-handed pitchers. The windowed
+# split features (G{int}_vL_wOBA, P_G{int}_vR_K%, ...) are computed from them
+# once per player per game, like the rest of the player stats.
+
+# External imports
+import pandas as pd
+
+# Hands, and the hand assumed for players missing from the rosters
+sides = ['L', 'R']
+default_hand = 'R'
+
+# Counting stats kept for each side
+batting_split_stats = ['PA', 'AB', 'H', '2B', '3B', 'HR', 'HR4', 'BB', 'IBB', 'HP', 'SF', 'SO']
+pitching_split_stats = ['TBF', 'AB', 'H', '2B', '3B', 'HR', 'HR4', 'BB', 'IBB', 'HP', 'SF', 'SO']
+
+# Columns of the splits in the stats store
+batting_split_cols = [f'B_v{side}_{stat}' for side in sides for stat in batting_split_stats]
+pitching_split_cols = [f'P_v{side}_{stat}' for side in sides for stat in pitching_split_stats]
+
+# Split features, for each side:
+#  * PA   - Plate appearances (batters faced for pitchers)
+#  * K%   - Strikeout rate
+#  * BB%  - Walk rate
+#  * wOBA - Weighted on-base average (against for pitchers)
+split_derived = {'K%': lambda x: x['SO']/x['PA'] if x['PA'] != 0 else 0,
+                 'BB%': lambda x: x['BB']/x['PA'] if x['PA'] != 0 else 0}
+split_feats = [f'v{side}_{stat}' for side in sides for stat in ['PA', 'K%', 'BB%', 'wOBA']]
+
+# Side a batter hits from against a pitcher
+#
+# Input:
+#  - bats (char): batter's batting hand from the rosters, L, R or B
+#  - throws (char): pitcher's throwing hand from the rosters
+def batting_side(bats, throws):
+    if bats == 'B':
+        return 'R' if throws == 'L' else 'L'
+    return bats if bats in sides else default_hand
+
+# Side a pitcher throws from
+def pitching_side(throws):
+    return throws if throws in sides else default_hand
+
+# Empty split accumulators
+def new_splits(stats):
+    return {side: dict.fromkeys(stats, 0) for side in sides}
+
+# Games of a player's stats store, with one side's split columns renamed to the
+# batting columns, so the batting stat functions (calcwOBA) can be used on them.
+#
+# Input:
+#  - df (Dataframe): window of the player's stats store
+#  - facet (str): 'B_' or 'P_'
+#  - side (char): L or R
+def side_frame(df, facet, side):
+    stats = batting_split_stats if facet == 'B_' else pitching_split_stats
+    frame = pd.DataFrame({'B_'+('PA' if stat == 'TBF' else stat): df[f'{facet}v{side}_{stat}'] for stat in stats})
+    frame['date'] = df['date']
+    return frame
@@ -8,6 +8,10 @@ import sys
 # Adding top level project directory
 sys.path.insert(0, '../../')
 
+# Internal imports
+from players.splits import batting_split_stats, new_splits, side_frame, sides, split_derived, split_feats
+from processors.reference import woba_weights
+
 woba_cols = ['AB', 'BB', 'HP', 'H', '2B', '3B', 'HR', 'HR4', 'IBB', 'SF', 'PA']
 wTB = lambda w, x: (w['wBB']*x['BB']+w['wHBP']*x['HP']+w['w1B']*x['1B']+w['w2B']*x['2B']+w['w3B']*x['3B']+w['wHR']*(x['HR']+x['HR4'])).iloc[0]
 wOBA = lambda w, x: (x['wTB']/(x['AB']+x['BB']-x['IBB']+x['SF']+x['HP']))
@@ -27,6 +31,13 @@ def calcwOBA(stats, consts):
     return wOBA(w, sts) if (sts['AB']+sts['BB']-sts['IBB']+sts['SF']+sts['HP']) != 0 else 0
 
 
+# Row of a game in a player's stats, or the row it would be at for a game the
+# player didn't appear in. The stats are sorted by game (see players/store.py).
+def game_row(stats_df, game_id):
+    order = np.array([int(key[3:]) for key in stats_df['game.key']], dtype=np.int64)
+    return int(np.searchsorted(order, int(game_id[3:]), side='left'))
+
+
 wRAA = lambda w, x: (((x['wOBA']-w['wOBA'])/w['wOBAScale'])*x['PA']).iloc[0]
 
 def calcwRAA(stats, consts):
@@ -95,17 +106,28 @@ class BattingStats:
     weighted_stats = {'wOBA': calcwOBA,
                       'wRAA': calcwRAA}
 
-    stats = counting_stats + list(derived_stats.keys()) + list(weighted_stats.keys())
+    # Platoon split stats, see players/splits.py
+    split_stats = split_feats
+
+    stats = counting_stats + list(derived_stats.keys()) + list(weighted_stats.keys()) + split_stats
 
     # Populate player's batting stats upon construction
-    def __init__(self, game_id, player_id, stat_features, intervals=(40, 81, 162)):
+    #
+    # played is False for players read without appearing in the game (see
+    # teams/aggregates.py), whose stats are read up to the game.
+    def __init__(self, game_id, player_id, stat_features, intervals=(40, 81, 162), played=True):
         
         # Player associated with these stats
         self.gid = game_id
         self.pid = player_id
+        self.played = played
+        # Date of the player's last game before this one
+        self.last_date = None
         
         # Initialize in-game player counting stats
         self.in_game_stats = {stat_name: 0 for stat_name in BattingStats.counting_stats}
+        # In-game counting stats split by the opponent's hand
+        self.in_game_splits = new_splits(batting_split_stats)
 
         # Initialize player stats over given intervals
         self.intervals = intervals
@@ -124,13 +146,17 @@ class BattingStats:
         # Read stats for the given game
         stats_df = pd.read_csv(BattingStats.path+f'/{self.pid}.csv')
         stats_df['date'] = pd.to_datetime(stats_df['date'])
-        constants_df = pd.read_csv('./data/wOBA-weights.csv')
-        if (stats_df['game.key'] == self.gid).any():
+        constants_df = woba_weights()
+        if not self.played:
+            present = game_row(stats_df, self.gid)
+        elif (stats_df['game.key'] == self.gid).any():
             present = stats_df.index[stats_df['game.key'] == self.gid][0]
         else:
             print(f'Error while processing {self.gid}.')
             print(f'Couldnt find {self.gid} in {self.pid} stats')
             assert(False)
+        if present:
+            self.last_date = stats_df['date'].iloc[present-1]
         # Populate from retrosplits into the batter stats object
         for past in self.intervals:
             # Get games in the given interval
@@ -144,6 +170,16 @@ class BattingStats:
             # Calculate weighted stats (weighted based on year)
             for ws in BattingStats.weighted_stats:
                 self.stats[past][ws] = BattingStats.weighted_stats[ws](df, constants_df)
+            # Calculate split stats, only when they're features so stores built
+            # before the splits can still be used
+            if set(self.stat_features) & set(BattingStats.split_stats):
+                for side in sides:
+                    side_df = side_frame(df, 'B_', side)
+                    sts = {'PA': side_df['B_PA'].sum(), 'SO': side_df['B_SO'].sum(), 'BB': side_df['B_BB'].sum()}
+                    self.stats[past][f'v{side}_PA'] = sts['PA']
+                    for ds in split_derived:
+                        self.stats[past][f'v{side}_{ds}'] = split_derived[ds](sts)
+                    self.stats[past][f'v{side}_wOBA'] = calcwOBA(side_df, constants_df)
 
     def featurize(self):
         if self.historical_stats is None:
@@ -161,7 +197,6 @@ class BattingStats:
         for name in stats:
             self.in_game_stats[name] += 1
 
-    # Get the player's stats for a given game
-    def get_game_stats(self, game_id, stat_path):
-        stats_df = pd.read_csv(stat_path+f'/{self.pid}.csv')
-        return stats_df[stats_df['game.key'] == game_id].iloc[0]
+    # Adds the value to the given stat split against the opponent's hand
+    def add_to_split(self, side, stat, value):
+        self.in_game_splits[side][stat] += value
@@ -8,6 +8,12 @@ import sys
 # Adding top level project directory
 sys.path.insert(0, '../../')
 
+# Internal imports
+from players.fatigue import fatigue_stats, load_index
+from players.splits import pitching_split_stats, new_splits, side_frame, sides, split_derived, split_feats
+from players.stats.batting import calcwOBA, game_row
+from processors.reference import woba_weights
+
 # It's difficult to define FIP across seasons because of the FIP constant is
 # defined on a per season basis.
 #
@@ -93,20 +99,35 @@ class PitchingStats:
 
     weighted_stats = {'FIP': calcFIP}
 
-    stats = counting_stats + list(derived_stats.keys()) + list(weighted_stats.keys())
+    # Platoon split stats, see players/splits.py
+    split_stats = split_feats
+
+    # Fatigue stats, see players/fatigue.py. These are counted in days before
+    # the game rather than over game intervals.
+    fatigue_stats = fatigue_stats
+
+    stats = (counting_stats + list(derived_stats.keys()) + list(weighted_stats.keys()) + split_stats +
+             fatigue_stats)
 
-    def __init__(self, game_id, player_id, stat_features, intervals=(5, 10, 20)):
+    #
+    # played is False for players read without appearing in the game (see
+    # teams/aggregates.py), whose stats are read up to the game.
+    def __init__(self, game_id, player_id, stat_features, intervals=(5, 10, 20), played=True):
         #
         # Player associated with these stats
         self.gid = game_id
         self.pid = player_id
+        self.played = played
         #
         # Initialize in-game player counting stats
         self.in_game_stats = {stat_name: 0 for stat_name in PitchingStats.counting_stats}
+        # In-game counting stats split by the opponent's hand
+        self.in_game_splits = new_splits(pitching_split_stats)
         #
         # Initialize player stats over given intervals
         self.intervals = intervals
         self.historical_stats = None
+        self.fatigue = None
         #
         # Stats from this player's pitching we want as features in our dataset
         for stat in stat_features:
@@ -120,8 +141,11 @@ class PitchingStats:
         # Read stats from retrosplits
         stats_df = pd.read_csv(PitchingStats.path+f'/{self.pid}.csv')
         stats_df['date'] = pd.to_datetime(stats_df['date'])
-        constants_df = pd.read_csv('data/wOBA-weights.csv')
-        present = stats_df.index[stats_df['game.key'] == self.gid][0]
+        constants_df = woba_weights()
+        if self.played:
+            present = stats_df.index[stats_df['game.key'] == self.gid][0]
+        else:
+            present = game_row(stats_df, self.gid)
         # Populate from retrosplits into the batter stats object
         for past in self.intervals:
             # Get games in the given interval
@@ -135,6 +159,19 @@ class PitchingStats:
             # Calculate weighted stats (weighted based on year)
             for ws in PitchingStats.weighted_stats:
                 self.stats[past][ws] = PitchingStats.weighted_stats[ws](df, constants_df)
+            # Calculate split stats, only when they're features so stores built
+            # before the splits can still be used
+            if set(self.stat_features) & set(PitchingStats.split_stats):
+                for side in sides:
+                    side_df = side_frame(df, 'P_', side)
+                    sts = {'PA': side_df['B_PA'].sum(), 'SO': side_df['B_SO'].sum(), 'BB': side_df['B_BB'].sum()}
+                    self.stats[past][f'v{side}_PA'] = sts['PA']
+                    for ds in split_derived:
+                        self.stats[past][f'v{side}_{ds}'] = split_derived[ds](sts)
+                    self.stats[past][f'v{side}_wOBA'] = calcwOBA(side_df, constants_df)
+        # Calculate fatigue stats
+        if set(self.stat_features) & set(PitchingStats.fatigue_stats):
+            self.fatigue = load_index(PitchingStats.path+f'/{self.pid}.csv').featurize(present, self.gid)
 
     def featurize(self):
         if self.historical_stats is None:
@@ -143,7 +180,11 @@ class PitchingStats:
             feat_dict = {}
             for i in self.intervals:
                 for stat in self.stat_features:
-                    feat_dict[f'P_G{i}_{stat}'] = self.stats[i][stat]
+                    if not stat in PitchingStats.fatigue_stats:
+                        feat_dict[f'P_G{i}_{stat}'] = self.stats[i][stat]
+            for stat in self.stat_features:
+                if stat in PitchingStats.fatigue_stats:
+                    feat_dict[f'P_{stat}'] = self.fatigue[stat]
             self.features = pd.Series(feat_dict, dtype=np.float64)
         return self.features
 
@@ -152,11 +193,10 @@ class PitchingStats:
         for name in stats:
             self.in_game_stats[name] += 1
 
+    # Adds the value to the given stat split against the opponent's hand
+    def add_to_split(self, side, stat, value):
+        self.in_game_splits[side][stat] += value
+
     # Adds the value to the given stat
     def add_to_stat(self, stat, value):
         self.in_game_stats[stat] += value
-
-    # Get the player's stats for a given game
-    def get_game_stats(self, game_id, stat_path):
-        stats_df = pd.read_csv(stat_path+f'/{self.pid}.csv')
-        return stats_df[stats_df['game.key'] == game_id].iloc[0]
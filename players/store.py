@@ -0,0 +1,188 @@
+# This file defines the player day-by-day stats store.
+#
+# The store holds one csv per player, ./data/players-daybyday/{pid}.csv, with a
+# row of counting stats for every game the player appeared in, sorted by game.
+# Batter vs pitcher matchups are kept in one more csv, matchups.csv, with a row
+# of the batter's counting stats against the pitcher for every game they faced
+# each other in, sorted by batter, pitcher and game (see players/matchups.py).
+# Team games are kept in teams.csv, with a row of each team's runs and summed
+# counting stats for every game it played, sorted by team and game (see
+# teams/history.py).
+#
+# Workers never write to the player files directly. Each worker writes the rows
+# for the games it processed to its own shard, and merge_shards() combines the
+# shards with the store once all workers are finished. This way parallel
+# workers never touch the same file.
+
+# External imports
+import glob
+import os
+import pandas as pd
+
+# Internal imports
+from players.splits import batting_split_cols, pitching_split_cols
+from players.stats.batting import BattingStats
+from players.stats.pitching import PitchingStats
+
+# Path to the store and the shards waiting to be merged into it
+store_path = './data/players-daybyday'
+shard_path = store_path+'/shards'
+
+# Columns of each player's file
+stat_cols = (['B_'+bstat for bstat in BattingStats.counting_stats] +
+             ['P_'+pstat for pstat in PitchingStats.counting_stats] +
+             batting_split_cols + pitching_split_cols)
+columns = stat_cols + ['game.key', 'date']
+
+# Batting stats kept for each matchup, and the columns of the matchup file
+matchup_stats = ['PA', 'AB', 'H', '2B', '3B', 'HR', 'HR4', 'BB', 'IBB', 'HP', 'SF', 'SO']
+matchup_cols = ['B_'+bstat for bstat in matchup_stats]
+matchup_columns = ['batter', 'pitcher', 'game.key'] + matchup_cols
+matchup_path = store_path+'/matchups.csv'
+matchup_shard_path = shard_path+'/matchups'
+
+# Stats summed over each team's players, and the columns of the team file
+team_batting_stats = ['PA', 'AB', 'H', '2B', '3B', 'HR', 'HR4', 'BB', 'IBB', 'HP', 'SF']
+team_pitching_stats = ['TBF', 'OUT', 'HR', 'HR4', 'BB', 'HP', 'SO']
+team_columns = (['team', 'game.key', 'date', 'home', 'R', 'RA'] +
+                ['B_'+bstat for bstat in team_batting_stats] + ['P_'+pstat for pstat in team_pitching_stats])
+team_path = store_path+'/teams.csv'
+team_shard_path = shard_path+'/teams'
+
+# Sort key for game ids, orders by date and then game number.
+game_order = lambda col: [int(x[3:]) for x in col]
+
+
+class StatsShard:
+    def __init__(self, name):
+        self.path = shard_path+f'/{name}.csv'
+        self.matchup_file = matchup_shard_path+f'/{name}.csv'
+        self.team_file = team_shard_path+f'/{name}.csv'
+        self.rows = []
+        self.matchup_rows = []
+        self.team_rows = []
+
+    # Adds the stat rows for every player on both teams of a finished game.
+    #
+    # Input:
+    #  - game (GameState): finished game
+    #
+    # Output:
+    #  None
+    def add_game(self, game):
+        for team in game.teams:
+            for plyr in team.roster.values():
+                row = plyr.stats_row(game.id, game.date)
+                row['person.key'] = plyr.id
+                self.rows.append(row)
+        for (batter, pitcher), stats in game.matchup_stats.items():
+            row = {'batter': batter, 'pitcher': pitcher, 'game.key': game.id}
+            row.update({'B_'+bstat: stats[bstat] for bstat in matchup_stats})
+            self.matchup_rows.append(row)
+        runs = [sum(plyr.batting.in_game_stats['R'] for plyr in team.roster.values() if plyr.batting)
+                for team in game.teams]
+        for home, team in enumerate(game.teams):
+            row = {'team': team.id, 'game.key': game.id, 'date': game.date, 'home': home,
+                   'R': runs[home], 'RA': runs[not home]}
+            for bstat in team_batting_stats:
+                row['B_'+bstat] = sum(plyr.batting.in_game_stats[bstat] for plyr in team.roster.values() if plyr.batting)
+            for pstat in team_pitching_stats:
+                row['P_'+pstat] = sum(plyr.pitching.in_game_stats[pstat] for plyr in team.roster.values() if plyr.pitching)
+            self.team_rows.append(row)
+
+    # Writes the shard to disk.
+    #
+    # The shard is written to a temporary file first and then renamed, so a
+    # partially written shard is never merged.
+    def close(self):
+        if not os.path.exists(shard_path):
+            os.makedirs(shard_path, exist_ok=True)
+        df = pd.DataFrame(self.rows, columns=['person.key']+columns)
+        df.to_csv(self.path+'.tmp', index=False)
+        os.replace(self.path+'.tmp', self.path)
+        self.rows = []
+        if not os.path.exists(matchup_shard_path):
+            os.makedirs(matchup_shard_path, exist_ok=True)
+        df = pd.DataFrame(self.matchup_rows, columns=matchup_columns)
+        df.to_csv(self.matchup_file+'.tmp', index=False)
+        os.replace(self.matchup_file+'.tmp', self.matchup_file)
+        self.matchup_rows = []
+        if not os.path.exists(team_shard_path):
+            os.makedirs(team_shard_path, exist_ok=True)
+        df = pd.DataFrame(self.team_rows, columns=team_columns)
+        df.to_csv(self.team_file+'.tmp', index=False)
+        os.replace(self.team_file+'.tmp', self.team_file)
+        self.team_rows = []
+
+
+# Merges all shards into the store and removes them.
+#
+# Shards are read in sorted order, and players are written in sorted order, so
+# the result doesn't depend on the order the workers finished in.
+#
+# Input:
+#  - overwrite (bool): replace games that are already in the store, otherwise
+#                      they are kept and the new rows are skipped
+#
+# Output:
+#  None
+def merge_shards(overwrite=False):
+    shards = sorted(glob.glob(shard_path+'/*.csv'))
+    if not shards:
+        return
+    new_df = pd.concat([pd.read_csv(shard) for shard in shards], ignore_index=True)
+    # If the same game is in more than one shard, the last shard wins.
+    new_df = new_df.drop_duplicates(subset=['person.key', 'game.key'], keep='last')
+    for pid, rows in new_df.groupby('person.key', sort=True):
+        rows = rows[columns]
+        player_file = store_path+f'/{pid}.csv'
+        if os.path.isfile(player_file):
+            old = pd.read_csv(player_file)
+            if overwrite:
+                old = old[~old['game.key'].isin(rows['game.key'])]
+            else:
+                rows = rows[~rows['game.key'].isin(old['game.key'])]
+            df = pd.concat([old, rows], ignore_index=True)
+        else:
+            df = rows
+        df = df.sort_values(by='game.key', key=game_order, kind='stable', ignore_index=True)
+        # Keep the counting stats as integers with blanks for missing stats
+        df[stat_cols] = df[stat_cols].astype('Int64')
+        df.to_csv(player_file+'.tmp', index=False)
+        os.replace(player_file+'.tmp', player_file)
+    for shard in shards:
+        os.remove(shard)
+    merge_table_shards(matchup_path, matchup_shard_path, ['batter', 'pitcher'], overwrite)
+    merge_table_shards(team_path, team_shard_path, ['team'], overwrite)
+
+# Merges the shards of one of the single file tables (matchups or teams) into
+# the table and removes them.
+#
+# Like the player files, games that are already in the table are only replaced
+# with overwrite.
+#
+# Input:
+#  - path (str): path to the table
+#  - shards_dir (str): directory of the table's shards
+#  - key_cols (list): columns the rows of each game are keyed by, the table is
+#                     sorted by them and then by game
+#  - overwrite (bool): replace games that are already in the table
+def merge_table_shards(path, shards_dir, key_cols, overwrite=False):
+    shards = sorted(glob.glob(shards_dir+'/*.csv'))
+    if not shards:
+        return
+    df = pd.concat([pd.read_csv(shard) for shard in shards], ignore_index=True)
+    df = df.drop_duplicates(subset=key_cols+['game.key'], keep='last')
+    if os.path.isfile(path):
+        old = pd.read_csv(path)
+        if overwrite:
+            old = old[~old['game.key'].isin(df['game.key'])]
+        else:
+            df = df[~df['game.key'].isin(old['game.key'])]
+        df = pd.concat([old, df], ignore_index=True)
+    df = df.sort_values(by='game.key', key=game_order, kind='stable')
+    df = df.sort_values(by=key_cols, kind='stable', ignore_index=True)
+    df.to_csv(path+'.tmp', index=False)
+    os.replace(path+'.tmp', path)
+    for shard in shards:
+        os.remove(shard)
@@ -0,0 +1,25 @@
+# This file defines the index of game offsets within a Retrosheet event file.
+#
+# Every game in an event file starts with an 'id' line, so the byte offsets of
+# those lines split the file into independent chunks that can be processed on
+# their own.
+
+# External imports
+import re
+
+# Matches the 'id' line at the start of each game.
+game_ptrn = re.compile(rb'^id,(\w+)', re.MULTILINE)
+
+# Indexes the games in an event file.
+#
+# Input:
+#  - path (str): path to the event file
+#
+# Output:
+#  List of (game id, start byte, end byte) tuples in file order
+def index_games(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    matches = list(game_ptrn.finditer(data))
+    ends = [m.start() for m in matches[1:]] + [len(data)]
+    return [(m.group(1).decode(), m.start(), end) for m, end in zip(matches, ends)]
@@ -11,8 +11,15 @@ class Logger:
         # Make directories and file if it doesn't exit
         self.path = Path(filename)
         self.path.parent.mkdir(exist_ok=True, parents=True)
+        # Messages waiting to be written
+        self.buffer = []
 
     def log(self, message=''):
+        self.buffer.append(str(message) + '\n')
+
+    # Writes the buffered messages to the log file.
+    def flush(self):
         stream = self.path.open('a')
-        stream.write(str(message) + '\n')
+        stream.writelines(self.buffer)
         stream.close()
+        self.buffer = []
@@ -0,0 +1,307 @@
+# This file defines the work manifest used to share tasks between nodes.
+#
+# Several nodes that can see the same output directory, for example over an NFS
+# mount, can split a build between them without a coordinator. The first node
+# to start publishes the task list to the manifest directory, and every worker
+# on every node then claims tasks from it one at a time:
+#
+#  - A task is claimed by atomically creating its lock file. Only one worker
+#    can create the file, so only one worker processes the task.
+#  - While a task is being processed, the owner keeps touching its lock file.
+#    If the lock hasn't been touched for longer than the lease, the owner is
+#    assumed dead and any worker may reclaim the task.
+#  - When a task is finished a done marker is written and the lock removed.
+#
+# Each task list gets its own manifest directory, named by a hash of the task
+# keys and the configuration, so a run with other years, teams or features
+# never reuses the done markers of an earlier one. To rebuild the same task
+# list from scratch, delete {output_path}/manifest (or the run's directory
+# inside it) while no node is running.
+#
+# Lease times are measured against the file system's clock, not the node's, so
+# nodes with skewed clocks agree on when a lease expires.
+
+# External imports
+import hashlib
+import os
+import pandas as pd
+import socket
+import threading
+import time
+
+# Internal imports
+from processors import scheduler
+from processors.progress import report_skipped
+from processors.scheduler import Task
+
+
+class Manifest:
+    def __init__(self, path, lease=600):
+        self.path = path
+        self.lease = lease
+        for subdir in ('locks', 'done'):
+            os.makedirs(self.path+f'/{subdir}', exist_ok=True)
+
+    # Name of this worker written into its lock files.
+    @property
+    def owner(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    # Unique name of a task within the manifest.
+    def key(self, task):
+        return f'{task.year}-{task.team}-{task.game}' if task.game else f'{task.year}-{task.team}'
+
+    # Current time according to the file system.
+    def now(self):
+        clock = self.path+f'/locks/clock-{self.owner}'
+        with open(clock, 'w'):
+            pass
+        now = os.stat(clock).st_mtime
+        os.remove(clock)
+        return now
+
+    # True if this worker holds the task's lock.
+    def owns(self, task):
+        try:
+            with open(self.lock_file(task)) as lock:
+                return lock.read() == self.owner
+        except FileNotFoundError:
+            return False
+
+    # Removes the task's lock if this worker still holds it. A worker that
+    # stalled past its lease may have lost the lock to another one.
+    def release(self, task):
+        if self.owns(task):
+            try:
+                os.remove(self.lock_file(task))
+            except FileNotFoundError:
+                pass
+
+    # Publishes the task list, unless another node already has.
+    #
+    # Input:
+    #  - tasks (list): tasks from scheduler.build_tasks()
+    #
+    # Output:
+    #  List of tasks in the manifest, in the same order for every node
+    def publish(self, tasks):
+        manifest_file = self.path+'/tasks.csv'
+        if not os.path.isfile(manifest_file):
+            df = pd.DataFrame(tasks, columns=Task._fields)
+            df['span'] = [f'{t.span[0]}-{t.span[1]}' if t.span else '' for t in tasks]
+            tmp = manifest_file+f'.{self.owner}'
+            df.to_csv(tmp, index=False)
+            # Linking fails if the manifest exists, so exactly one node wins.
+            try:
+                os.link(tmp, manifest_file)
+            except FileExistsError:
+                pass
+            os.remove(tmp)
+        df = pd.read_csv(manifest_file, keep_default_na=False, dtype={'game': str, 'span': str})
+        return [Task(row['year'], row['team'], row['league'], row['name'], row['game'],
+                     row['size'], tuple(int(x) for x in row['span'].split('-')) if row['span'] else None)
+                for _, row in df.iterrows()]
+
+    def lock_file(self, task):
+        return self.path+f'/locks/{self.key(task)}.lock'
+
+    def done_file(self, task):
+        return self.path+f'/done/{self.key(task)}'
+
+    def is_done(self, task):
+        return os.path.isfile(self.done_file(task))
+
+    # True if the file hasn't been touched within the lease.
+    def is_expired(self, path):
+        try:
+            return self.now() - os.stat(path).st_mtime > self.lease
+        except FileNotFoundError:
+            return False
+
+    # Tries to claim a task.
+    #
+    # Input:
+    #  - task (Task): task to be claimed
+    #
+    # Output:
+    #  True if this worker now owns the task
+    def claim(self, task):
+        if self.is_done(task):
+            return False
+        lock = self.lock_file(task)
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Try again once if the lock was left behind by a dead worker.
+                if self.reclaim(lock):
+                    continue
+                return False
+            os.write(fd, self.owner.encode())
+            os.close(fd)
+            # The task could have finished between the check and the claim.
+            if self.is_done(task):
+                self.release(task)
+                return False
+            return True
+        return False
+
+    # Removes an expired lock.
+    #
+    # Only one worker at a time may reclaim a lock, otherwise two workers could
+    # both remove the lock and one of them would remove the other's new claim.
+    #
+    # Input:
+    #  - lock (str): path to the lock file
+    #
+    # Output:
+    #  True if the lock was removed
+    def reclaim(self, lock):
+        if not self.is_expired(lock):
+            return False
+        guard = lock+'.reclaim'
+        try:
+            fd = os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Clean up after a worker that died while reclaiming.
+            if self.is_expired(guard):
+                try:
+                    os.remove(guard)
+                except FileNotFoundError:
+                    pass
+            return False
+        os.close(fd)
+        try:
+            if not self.is_expired(lock):
+                return False
+            print(f'Reclaiming expired lock {lock}')
+            os.remove(lock)
+            return True
+        except FileNotFoundError:
+            return True
+        finally:
+            os.remove(guard)
+
+    # Marks a claimed task as finished and releases its lock.
+    def complete(self, task):
+        with open(self.done_file(task), 'w') as marker:
+            marker.write(self.owner)
+        self.release(task)
+
+
+# Directory of the manifest of a task list.
+#
+# Input:
+#  - config (Configuration): input configuration
+#  - tasks (list): tasks from scheduler.build_tasks()
+#
+# Output:
+#  {output_path}/manifest/{hash of the task keys and configuration}
+def manifest_path(config, tasks):
+    # Paths are left out since nodes may mount the same directories elsewhere
+    settings = sorted((name, value) for name, value in vars(config).items() if not name.endswith('_path'))
+    keys = [f'{task.year}-{task.team}-{task.game}' for task in tasks]
+    digest = hashlib.sha1(repr((keys, settings)).encode()).hexdigest()[:12]
+    return config.output_path+f'/manifest/{digest}'
+
+
+# Keeps the lease on a claimed task alive while it is processed.
+class Heartbeat:
+    def __init__(self, manifest, task):
+        self.manifest = manifest
+        self.task = task
+        self.lock = manifest.lock_file(task)
+        self.interval = manifest.lease/4
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, daemon=True)
+
+    def beat(self):
+        while not self.stopped.wait(self.interval):
+            # Stop once the lock was reclaimed, it's another worker's now
+            if not self.manifest.owns(self.task):
+                return
+            try:
+                os.utime(self.lock)
+            except FileNotFoundError:
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+# Worker function that only processes a task if it can claim it.
+#
+# Wraps another worker function with the signature of scheduler.run_task().
+class ClaimedTask:
+    def __init__(self, task_fn, manifest):
+        self.task_fn = task_fn
+        self.manifest = manifest
+
+    def __call__(self, config, task, proc_kwargs):
+        if not self.manifest.claim(task):
+            # Done or held elsewhere, it no longer counts towards the progress
+            report_skipped(proc_kwargs.get('progress'), task.size)
+            return None
+        with Heartbeat(self.manifest, task):
+            result = self.task_fn(config, task, proc_kwargs)
+        self.manifest.complete(task)
+        return result
+
+
+# Processes the manifest's tasks on this node until every task is done.
+#
+# Tasks held by workers on other nodes are skipped, and the pending tasks are
+# checked again after each pass so that tasks from dead nodes are picked up
+# once their lease expires.
+#
+# Input:
+#  - config (Configuration): input configuration
+#  - tasks (list): tasks from scheduler.build_tasks()
+#  - njobs (int): number of workers on this node
+#  - task_fn (function): worker function with run_task's signature
+#  - lease (int): seconds without a heartbeat before a task is reclaimed
+#  - poll (int): seconds to wait between passes
+#  - progress (bool): show a live progress line for each pass
+#  - proc_kwargs: keyword arguments for the processor
+#
+# Output:
+#  Manifest of the tasks, for run_step()
+def run(config, tasks, njobs, task_fn, lease=600, poll=10, progress=False, **proc_kwargs):
+    manifest = Manifest(manifest_path(config, tasks), lease=lease)
+    tasks = manifest.publish(tasks)
+    worker_fn = ClaimedTask(task_fn, manifest)
+    while True:
+        pending = [task for task in tasks if not manifest.is_done(task)]
+        if not pending:
+            break
+        scheduler.run(config, pending, njobs, task_fn=worker_fn, progress=progress, **proc_kwargs)
+        if any(not manifest.is_done(task) for task in pending):
+            time.sleep(poll)
+    return manifest
+
+# Runs a follow up step on exactly one node once the manifest's tasks are done,
+# for example merging the outputs of a season.
+#
+# If the node running the step dies, another node reclaims it once its lease
+# expires.
+#
+# Input:
+#  - manifest (Manifest): manifest returned by run()
+#  - config (Configuration): input configuration
+#  - task (Task): pseudo task naming the step
+#  - step_fn (function): worker function with run_task's signature
+#  - poll (int): seconds to wait between attempts
+#
+# Output:
+#  None
+def run_step(manifest, config, task, step_fn, poll=10):
+    worker_fn = ClaimedTask(step_fn, manifest)
+    while not manifest.is_done(task):
+        worker_fn(config, task, {})
+        if not manifest.is_done(task):
+            time.sleep(poll)
@@ -11,11 +11,21 @@ import sys
 
 # Internal imports
 from configuration import Configuration
+from datasets.backends import open_backends
+from datasets.transitions import encode_action
 from games.game import GameState
 from players.player import Player
+from players.matchups import MatchupFeatures
+from players.splits import batting_side, batting_split_stats, pitching_side, pitching_split_stats
+from players.store import StatsShard, matchup_stats
 from players.stats.batting import BattingStats
 from players.stats.pitching import PitchingStats
 from processors.log import Logger
+from processors.reference import season_hands
+from processors.verify import StatVerifier
+from processors.writer import BackgroundWriter
+from teams.aggregates import RosterAggregates
+from teams.history import TeamHistory
 from teams.team import Team
 
 # Adding top level project directory
@@ -83,6 +93,18 @@ class Processor:
                                         bool(Processor.bunt_ptrn.match(m)) for m in modifiers
                                     ])
     
+    # Batted ball types and the modifiers that give them:
+    # B bunt, G ground ball, L line drive, P pop up, F fly ball
+    hit_type_ptrns = [('B', re.compile(r'^B[GPLF]')),
+                      ('G', re.compile(r'^G(\d|[DT]P|[#\+\-]|$)')),
+                      ('L', re.compile(r'^L(\d|[DT]P|[\+\-]|$)')),
+                      ('P', re.compile(r'^(P(\d|[\+\-]|$)|IF$)')),
+                      ('F', re.compile(r'^\d?F(\d|[DT]P|[\+\-]|$)'))]
+
+    # Batted ball type of a play, or '' if the modifiers don't give one
+    get_hit_type = lambda modifiers: next((hit_type for hit_type, ptrn in Processor.hit_type_ptrns
+                                                     for m in modifiers if ptrn.match(m)), '')
+
     is_sacrifice = lambda modifiers: ('SH' in modifiers or 'SF' in modifiers)
 
     is_ground_out = lambda modifiers: (# Exclude sacrifices
@@ -128,7 +150,7 @@ class Processor:
                                     
 
 
-    def __init__(self, config, save_state=True, save_stats=False, overwrite=False, verify_path=''):
+    def __init__(self, config, save_state=True, save_stats=False, verify_path='', progress=None):
         # Configuration parameters
         self.config = config
         # Current game state
@@ -139,6 +161,10 @@ class Processor:
         self.next_score = [0, 0]
         self.next_runners = [False, False, False]
         self.next_bpos = 0
+        # Ids of the players who scored on the current play
+        self.scored = []
+        # Batting and throwing hands of the players in the current season
+        self.hands = {}
         # Create logger
         self.logger = None
         # Boolean to control batting order check
@@ -155,8 +181,25 @@ class Processor:
         assert(save_state != save_stats)
         self.save_state = save_state
         self.save_stats = save_stats
-        self.overwrite = overwrite
+        # Shard of the player stats store written by this processor
+        self.stats_shard = None
+        # Output backends the game states are written to
+        self.backends = []
+        # Batter vs pitcher features, read from the stats store
+        self.matchups = None
+        if save_state and config.matchup_feats:
+            self.matchups = MatchupFeatures(config.matchup_feats, config.matchup_seasons)
+        # Thread that writes outputs while the next game is processed
+        self.writer = None
+        # Queue to report finished games to the parent's progress monitor
+        # (see processors/progress.py), and the counts for the current game.
+        self.progress = progress
+        self.game_events = 0
+        self.game_bytes = 0
         self.verify_path = verify_path
+        # Accumulates the in-game stats to be verified in bulk against the
+        # retrosplits data in verify_path.
+        self.verifier = StatVerifier() if verify_path else None
         # If we are saving the stats, then we need to create the player stat
         # directory if it doesn't already exit.
         # Else, we are saving features and the stats directory should already be
@@ -174,15 +217,20 @@ class Processor:
         # save it to disk before starting the new game.
         if self.game:
             # Save game
-            self.game.end(self.next_score, 
-                          self.config.output_path+f'/{self.game.date.year}eve', 
+            self.game.end(self.next_score,
+                          backends=self.backends,
                           save_state=self.save_state,
-                          save_stats=self.save_stats,
-                          verify_stats_path=self.verify_path)
+                          stats_shard=self.stats_shard,
+                          verifier=self.verifier,
+                          writer=self.writer)
+            self.writer.submit(self.logger.flush)
+            self.report_progress()
         # Start new game
-        self.game = GameState(row[1][:-1]) # game id
-        print(self.game.id)
+        self.game = GameState(row[1][:-1], matchups=self.matchups) # game id
+        if not self.progress:
+            print(self.game.id)
         year = row[1][3:7] # pull year from game id
+        self.hands = season_hands(self.config.input_path+f'/{year}eve')
         self.logger = Logger(self.config.log_path+f'/{year}eve/{row[1][:-1]}.log')
         self.logger.log('---------------------------------------------------')
         self.logger.log(self.game.id)
@@ -224,6 +272,17 @@ class Processor:
             assert(self.game)
             self.game.info[key] = value[:-1]
 
+        # Bullpen, bench and history features of the new team
+        if key in ('visteam', 'hometeam') and self.save_state:
+            team = self.game.teams[key == 'hometeam']
+            year = self.game.id[3:7]
+            if self.config.team_aggregates:
+                team.aggregates = RosterAggregates(self.config, self.game.id,
+                                                   self.config.input_path+f'/{year}eve/{team.id}{year}.ROS')
+            if self.config.team_feats:
+                team.history = TeamHistory(self.config.team_feats, self.config.team_intervals,
+                                           self.game.id, key == 'hometeam')
+
         # If we have enough info to determine our team names, then do so.
         if ((self.game.teams[0] and self.game.teams[1] and self.game.date) and
                 not (self.game.teams[0].name and self.game.teams[1].name)):
@@ -545,6 +604,7 @@ class Processor:
                 runner = self.game.teams[self.game.is_bot].roster[runner_tuple[0]]
                 owner_pitcher = self.game.teams[not self.game.is_bot].roster[runner_tuple[1]] if runner_tuple[1] else None
                 runner.batting.increment_stats(['R'])
+                self.scored.append(runner.id)
                 if owner_pitcher:
                     owner_pitcher.pitching.increment_stats(['R'])
                 # Check for inherited run scored.
@@ -1026,6 +1086,7 @@ class Processor:
         # advancement is not explicitly given.
         if all([a[0] != 'B' for a in adv]):
             self.next_score[self.game.is_bot] += 1
+            self.scored.append(batter.id)
             batter.batting.increment_stats(['R', 'RBI'])
             pitcher.pitching.increment_stats(['R', 'ER'])
         self.next_bpos = (self.next_bpos+1)%9
@@ -1212,7 +1273,7 @@ class Processor:
         assert(row[0] == 'play')
 
         # Unpack row
-        inning = row[1]
+        inning = int(row[1])
         team = int(row[2])
         batter_id = row[3]
         count = [int(row[4][0]), int(row[4][1])]
@@ -1227,6 +1288,10 @@ class Processor:
         self.game.runners[:] = self.next_runners[:]
         self.game.batter = batter_id
         self.game.count = count
+        # Kept to encode the action of the play
+        runner_ids = [r[0] if r else None for r in self.game.runners]
+        bpos = self.next_bpos
+        self.scored = []
 
         # Parse action string into play, advance, and modifier strings
         play, mods, adv = '', [], []
@@ -1280,6 +1345,12 @@ class Processor:
 
         # Get batter player
         batter = self.game.teams[self.game.is_bot].roster[batter_id]
+        rbi = batter.batting.in_game_stats['RBI']
+        # Kept to count the stats of the play against the opponent
+        if self.save_stats:
+            batter_before = dict(batter.batting.in_game_stats)
+            pitchers_before = {plyr.id: dict(plyr.pitching.in_game_stats)
+                               for plyr in self.game.teams[not self.game.is_bot].roster.values() if plyr.pitching}
 
         # Get the pitcher
         pitcher = self.game.teams[not self.game.is_bot].roster[self.game.teams[not self.game.is_bot].pitcher]
@@ -1569,9 +1640,32 @@ class Processor:
         self.logger.log(self.game)
         self.logger.log(play_str)
 
-        # Save game state
+        # Save game state, with the action taken in it and the play's row of
+        # the event table
         if self.save_state:
-            self.game.checkpoint()
+            action = encode_action(play_str, runner_ids, [r[0] if r else None for r in self.next_runners],
+                                   batter_id, self.scored, self.next_bpos != bpos)
+            self.game.checkpoint(action, {'Inning': inning,
+                                          'Bot': team,
+                                          'Outs': self.game.outs,
+                                          'Away': self.game.score[0],
+                                          'Home': self.game.score[1],
+                                          '1B': bool(runner_ids[0]),
+                                          '2B': bool(runner_ids[1]),
+                                          '3B': bool(runner_ids[2]),
+                                          'batter': batter_id,
+                                          'pitcher': pitcher.id,
+                                          'balls': count[0],
+                                          'strikes': count[1],
+                                          'pitches': pitches,
+                                          'event_text': event,
+                                          'event_type': action[0],
+                                          'hit_type': Processor.get_hit_type(mods),
+                                          'advance': action[1],
+                                          'runs': action[2],
+                                          'rbi': batter.batting.in_game_stats['RBI'] - rbi,
+                                          'outs_on_play': self.next_outs - self.game.outs,
+                                          'pa_end': self.next_bpos != bpos})
 
         # Update pitcher stats
         #
@@ -1593,6 +1687,10 @@ class Processor:
         # Increment outs stats
         pitcher.pitching.add_to_stat('OUT',   self.next_outs - self.game.outs)
 
+        # Add the play to the batter vs pitcher matchup and platoon splits
+        if self.save_stats:
+            self.record_opponent_stats(batter, pitcher, batter_before, pitchers_before)
+
         #
         # Reset after new inning
         assert(self.next_outs <= 3)
@@ -1604,6 +1702,36 @@ class Processor:
             self.next_bpos = self.game.teams[not self.game.is_bot].bpos
 
 
+    # Adds the stats of a play to the batter's stats against the pitcher and to
+    # the platoon splits of the batter and the pitchers in the field.
+    #
+    # Input:
+    #  - batter (Player): batter of the play
+    #  - pitcher (Player): pitcher responsible for the batter
+    #  - batter_before (dict): batter's in-game stats before the play
+    #  - pitchers_before (dict): pitcher id -> in-game stats before the play,
+    #                            for every pitcher on the fielding team
+    #
+    # Output:
+    #  None
+    def record_opponent_stats(self, batter, pitcher, batter_before, pitchers_before):
+        bats, _ = self.hands.get(batter.id, ('', ''))
+        _, throws = self.hands.get(pitcher.id, ('', ''))
+        # Batter's stats split by the pitcher's hand, and against the pitcher
+        diff = {bstat: batter.batting.in_game_stats[bstat] - batter_before[bstat] for bstat in batting_split_stats}
+        for bstat in batting_split_stats:
+            batter.batting.add_to_split(pitching_side(throws), bstat, diff[bstat])
+        if any(diff[bstat] for bstat in matchup_stats):
+            stats = self.game.matchup_stats.setdefault((batter.id, pitcher.id), dict.fromkeys(matchup_stats, 0))
+            for bstat in matchup_stats:
+                stats[bstat] += diff[bstat]
+        # Pitchers' stats split by the side the batter hit from
+        side = batting_side(bats, throws)
+        for pid, before in pitchers_before.items():
+            plyr = self.game.teams[not self.game.is_bot].roster[pid]
+            for pstat in pitching_split_stats:
+                plyr.pitching.add_to_split(side, pstat, plyr.pitching.in_game_stats[pstat] - before[pstat])
+
     def process_runner_adj(self, row):
         assert(row[0] == 'radj')
         base = int(row[2])-1
@@ -1621,6 +1749,14 @@ class Processor:
         self.logger.log(f'Lineup Adjustment - {self.game.teams[team].name} batting position is now {self.next_bpos}')
         self.logger.log(f'{self.game.teams[team].roster[pid].name} is now batting.')
 
+    # Reports the finished game to the progress monitor, if there is one.
+    def report_progress(self):
+        if self.progress:
+            states = len(self.game.past) if self.game.past else 0
+            self.progress.put((1, states, self.game_events, self.game_bytes, 0))
+        self.game_events = 0
+        self.game_bytes = 0
+
     # Featurizes a given team's home games (this is the way retrosheets
     # organizes the event files). Saves featurized game matricies to the
     # output path provided at initialization time.
@@ -1630,83 +1766,127 @@ class Processor:
     #  - team_id (string) - Retrosheet team id
     #  - team_lg (char) - Retrosheet league id (either 'A' or 'N')
     #  - game_id (string) - optional, Retrosheet game id to be processed
+    #  - span (tuple) - optional, (start, end) byte offsets of the games to be
+    #                   processed within the event file (see processors/index.py)
     #
     # Output:
     #    None
     #
-    def process_team(self, year, team_id, team_lg, game_id=''):
+    def process_team(self, year, team_id, team_lg, game_id='', span=None):
 
         # Open event file for the given year and team
         filepath = self.config.input_path+f'/{year}eve/'
         filename = f'{year}{team_id}.EV{team_lg}'
-        file = open(filepath+filename, 'r')
-        lines = file.readlines()
+        # Read the event file as bytes, so the byte count of every line is known
+        # for the progress monitor, and only the bytes of the given games if
+        # there's a span.
+        with open(filepath+filename, 'rb') as file:
+            if span:
+                file.seek(span[0])
+                raw_lines = file.read(span[1]-span[0]).splitlines(keepends=True)
+            else:
+                raw_lines = file.read().splitlines(keepends=True)
         skip = False
 
-        for line in lines:
-
-            # Parse string row
-            row = line.split(',')
-
-            # Process new game
-            # row = ['id', game id]
-            if row[0] == 'id':
-                if game_id:
-                    skip = (row[1][:-1] != game_id)
-                    if skip:
-                        continue
-                self.process_new_game(row)
+        # Outputs are written on a background thread
+        self.writer = BackgroundWriter()
 
-            # Skip this game's rows?
-            if skip:
-                continue
+        # Each call writes its player stats to its own shard
+        if self.save_stats:
+            self.stats_shard = StatsShard(f'{year}{team_id}' + (f'-{game_id}' if game_id else ''))
 
-            # Process teams
-            # row = ['info', home or away, team id]
-            #    or
-            # row = ['info', key, value]
-            if row[0] == 'info':
-                self.logger.log(line)
-                self.process_game_info(row)
-
-            # Process starting lineup
-            # row = ['start', player id, player name, team, batting pos, fielding pos]
-            if row[0] == 'start':
-                self.logger.log(line)
-                self.process_starting_lineup(row)
-
-            # Process substitutions
-            # row = ['sub', player id, name, team, batting pos, fielding pos]
-            # Example:  ['sub', 'florw001', '"Wilmer Flores"', '1', '4', '11\n']
-            if row[0] == 'sub':
-                self.logger.log(line)
-                self.process_substitutions(row)
-
-            # Process Play
-            # Note: think about this as evolving the game from one state to the next
-            #
-            # row = ['play', inning, team at bat, batter id, count, pitches, event]
-            # Example play: ['play', '9', '0', 'owinc001', '32', '.BTCBFBFX', 'T8/F89D+\n']
-            if row[0] == 'play':
-                self.logger.log(line)
-                self.process_play(row)
-
-            # Process runner adjustment
-            # Note: used for runners starting at 2nd base in extra innings
-            if row[0] == 'radj':
-                self.logger.log(line)
-                self.process_runner_adj(row)
-
-            # Process lineup adjustment
-            # Note: used for teams batting out of order
-            if row[0] == 'ladj':
-                self.logger.log(line)
-                self.process_lineup_adj(row)
+        # Each call writes its game states to its own part of the season outputs
+        if self.save_state:
+            self.backends = open_backends(self.config, year, game_id if game_id else f'{year}{team_id}')
+
+        try:
+            for raw_line in raw_lines:
+
+                # Decode with universal newlines, like reading the file in text
+                # mode, so lines end with '\n' whether the file uses LF or CRLF
+                self.game_bytes += len(raw_line)
+                line = raw_line.decode()
+                if line.endswith(('\r', '\n')):
+                    line = line.rstrip('\r\n') + '\n'
+
+                # Parse string row
+                row = line.split(',')
+
+                # Process new game
+                # row = ['id', game id]
+                if row[0] == 'id':
+                    if game_id:
+                        skip = (row[1][:-1] != game_id)
+                        if skip:
+                            continue
+                    self.process_new_game(row)
+
+                # Skip this game's rows?
+                if skip:
+                    continue
+
+                # Process teams
+                # row = ['info', home or away, team id]
+                #    or
+                # row = ['info', key, value]
+                if row[0] == 'info':
+                    self.logger.log(line)
+                    self.process_game_info(row)
+
+                # Process starting lineup
+                # row = ['start', player id, player name, team, batting pos, fielding pos]
+                if row[0] == 'start':
+                    self.logger.log(line)
+                    self.process_starting_lineup(row)
+
+                # Process substitutions
+                # row = ['sub', player id, name, team, batting pos, fielding pos]
+                # Example:  ['sub', 'florw001', '"Wilmer Flores"', '1', '4', '11\n']
+                if row[0] == 'sub':
+                    self.logger.log(line)
+                    self.process_substitutions(row)
+
+                # Process Play
+                # Note: think about this as evolving the game from one state to the next
+                #
+                # row = ['play', inning, team at bat, batter id, count, pitches, event]
+                # Example play: ['play', '9', '0', 'owinc001', '32', '.BTCBFBFX', 'T8/F89D+\n']
+                if row[0] == 'play':
+                    self.logger.log(line)
+                    self.process_play(row)
+                    self.game_events += 1
+
+                # Process runner adjustment
+                # Note: used for runners starting at 2nd base in extra innings
+                if row[0] == 'radj':
+                    self.logger.log(line)
+                    self.process_runner_adj(row)
+
+                # Process lineup adjustment
+                # Note: used for teams batting out of order
+                if row[0] == 'ladj':
+                    self.logger.log(line)
+                    self.process_lineup_adj(row)
+        except Exception:
+            # Write out the log of the game that failed for debugging.
+            if self.logger:
+                self.logger.flush()
+            raise
 
         # Save last game in the team
         self.game.end(self.next_score,
-                      self.config.output_path+f'/{self.game.date.year}eve',
+                      backends=self.backends,
                       save_state=self.save_state,
-                      save_stats=self.save_stats,
-                      verify_stats_path=self.verify_path,
-                      overwrite=self.overwrite)
+                      stats_shard=self.stats_shard,
+                      verifier=self.verifier,
+                      writer=self.writer)
+        self.writer.submit(self.logger.flush)
+        self.report_progress()
+        # Write out the player stats for the merge step
+        if self.stats_shard:
+            self.writer.submit(self.stats_shard.close)
+        # Write out the game state parts for the merge step
+        for backend in self.backends:
+            self.writer.submit(backend.close)
+        # Wait for the writes to finish
+        self.writer.close()
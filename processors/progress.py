@@ -0,0 +1,89 @@
+# This file defines the live progress display for parallel runs.
+#
+# Every processor reports the games it finishes over a shared queue. The parent
+# process aggregates the reports from all workers and renders a single status
+# line with the throughput and an estimate of the time remaining, based on how
+# many bytes of event files are left to be processed.
+#
+# Each report is a tuple (games, states, events, bytes, skipped). Tasks that a
+# worker skips, e.g. because another node claimed them, are reported with only
+# their size as skipped bytes, which are taken off the total.
+
+# External imports
+import datetime
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+
+
+# Reports a task that won't be processed, so it leaves the total.
+#
+# Input:
+#  - progress (Queue): monitor queue from the processor's progress argument,
+#                      or None when there's no monitor
+#  - nbytes (int): size of the task
+def report_skipped(progress, nbytes):
+    if progress:
+        progress.put((0, 0, 0, 0, nbytes))
+
+
+class ProgressMonitor:
+    # Input:
+    #  - total_bytes (int): size of all event files (or game spans) to process
+    #  - interval (float): seconds between updates of the status line
+    def __init__(self, total_bytes, interval=1.0):
+        self.total_bytes = total_bytes
+        self.interval = interval
+        # Totals over all workers
+        self.games = 0
+        self.states = 0
+        self.events = 0
+        self.bytes = 0
+        # Queue proxies can be passed to worker processes
+        self.manager = multiprocessing.Manager()
+        self.queue = self.manager.Queue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.listen, daemon=True)
+
+    # Reads reports off the queue and refreshes the status line.
+    def listen(self):
+        last = 0
+        while not (self.stopped.is_set() and self.queue.empty()):
+            try:
+                games, states, events, nbytes, skipped = self.queue.get(timeout=self.interval)
+                self.games += games
+                self.states += states
+                self.events += events
+                self.bytes += nbytes
+                self.total_bytes -= skipped
+            except queue.Empty:
+                pass
+            if time.time() - last >= self.interval:
+                self.render()
+                last = time.time()
+
+    def render(self):
+        elapsed = time.time() - self.start
+        rate = self.bytes/elapsed if elapsed else 0
+        remaining = max(self.total_bytes - self.bytes, 0)
+        eta = datetime.timedelta(seconds=int(remaining/rate)) if rate else '?'
+        done = 100*self.bytes/self.total_bytes if self.total_bytes else 100
+        line = (f'{self.games} games {self.states} states {self.events} events | '
+                f'{self.games/elapsed:.2f} games/s {self.states/elapsed:.1f} states/s | '
+                f'{done:.1f}% ETA {eta}')
+        sys.stdout.write('\r' + line.ljust(100))
+        sys.stdout.flush()
+
+    def __enter__(self):
+        self.start = time.time()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.render()
+        sys.stdout.write('\n')
+        self.manager.shutdown()
@@ -0,0 +1,65 @@
+# This file defines cached loaders for the reference tables used by every game.
+#
+# Each table is read from disk the first time it is requested and then kept in
+# memory for the lifetime of the process. Workers in a persistent pool only pay
+# for the reads once, no matter how many games they process.
+
+# External imports
+from functools import lru_cache
+import glob
+import pandas as pd
+
+# FanGraphs park factors by season and team name.
+@lru_cache(maxsize=None)
+def park_factors():
+    return pd.read_csv('./data/parkfactors.csv')
+
+# FanGraphs wOBA weights and FIP constants by season.
+@lru_cache(maxsize=None)
+def woba_weights():
+    return pd.read_csv('./data/wOBA-weights.csv')
+
+# Retrosheet team list for a season.
+#
+# Input:
+#  - teamspath (str): path to the TEAM{year} file in the retrosheet season dir
+#
+# Output:
+#  Dataframe with columns [id, league, city, name]
+@lru_cache(maxsize=None)
+def season_teams(teamspath):
+    teams_df = pd.read_csv(teamspath, header=None)
+    teams_df.columns = ['id', 'league', 'city', 'name']
+    return teams_df
+
+# Batting and throwing hands of every player on a season's rosters.
+#
+# Input:
+#  - seasonpath (str): path to the retrosheet season dir, which holds a
+#                      {team}{year}.ROS roster file for each team
+#
+# Output:
+#  dict of player id -> (bats, throws), each L, R or B
+@lru_cache(maxsize=None)
+def season_hands(seasonpath):
+    hands = {}
+    for rospath in sorted(glob.glob(seasonpath+'/*.ROS')):
+        ros_df = pd.read_csv(rospath, header=None, usecols=[0, 3, 4], dtype=str)
+        ros_df.columns = ['id', 'bats', 'throws']
+        # Players on several rosters keep the hands of the first one
+        for pid, bats, throws in ros_df.itertuples(index=False):
+            hands.setdefault(pid, (bats, throws))
+    return hands
+
+# Retrosheet roster of a team for a season.
+#
+# Input:
+#  - rospath (str): path to the {team}{year}.ROS file in the retrosheet season dir
+#
+# Output:
+#  Dataframe with columns [id, last, first, bats, throws, team, pos]
+@lru_cache(maxsize=None)
+def team_roster(rospath):
+    roster_df = pd.read_csv(rospath, header=None, dtype=str)
+    roster_df.columns = ['id', 'last', 'first', 'bats', 'throws', 'team', 'pos']
+    return roster_df
@@ -0,0 +1,125 @@
+# This file defines the scheduler that distributes processing tasks over a
+# single pool of worker processes.
+#
+# A task is either a whole event file, (year, team), or a single game within an
+# event file, (year, game). Once the player stats exist every game can be
+# featurized independently, so game tasks let the pool scale past the number of
+# teams in a season.
+#
+# All tasks for the requested range of seasons are queued up front and
+# dispatched longest first, using the size of the event file as an estimate of
+# the work. The same pool serves every season, so worker start up only happens
+# once and the reference caches in each worker stay warm between tasks.
+
+# External imports
+from collections import namedtuple
+from joblib import Parallel, delayed
+import os
+
+# Internal imports
+from processors.index import index_games
+from processors.processor import Processor
+from processors.progress import ProgressMonitor
+from processors.reference import season_teams
+
+# A unit of work.
+#  - year (int): season
+#  - team (str): Retrosheet team id of the event file
+#  - league (str): Retrosheet league id of the event file
+#  - name (str): team name used for logging
+#  - game (str): Retrosheet game id, or '' to process the whole event file
+#  - size (int): estimated amount of work in bytes of event file
+#  - span (tuple): (start, end) byte offsets of the game in the event file, or
+#                  None to scan the whole event file
+Task = namedtuple('Task', ['year', 'team', 'league', 'name', 'game', 'size', 'span'],
+                  defaults=[None])
+
+# Path to the event file for the given season and team.
+def event_file(config, year, team_id, team_lg):
+    return config.input_path+f'/{year}eve/{year}{team_id}.EV{team_lg}'
+
+# Builds the list of tasks for the given seasons, ordered longest first.
+#
+# Input:
+#  - config (Configuration): input configuration
+#  - years (iterable): seasons to be processed
+#  - team_id (str): optional, only process this team's event files
+#  - game_id (str): optional, only process this game
+#  - by_game (bool): optional, make one task per game instead of one task per
+#                    event file
+#
+# Output:
+#  List of tasks
+def build_tasks(config, years, team_id='', game_id='', by_game=False):
+    tasks = []
+    for year in years:
+        teams_df = season_teams(config.input_path+f'/{year}eve/TEAM{year}')
+        if game_id:
+            # Validate the given game happened during the current year
+            if year != int(game_id[3:7]):
+                continue
+            teams_df = teams_df.loc[teams_df['id'] == game_id[:3]]
+        elif team_id:
+            teams_df = teams_df.loc[teams_df['id'] == team_id]
+        for _, team in teams_df.iterrows():
+            path = event_file(config, year, team['id'], team['league'])
+            name = f"{team['city']} {team['name']}"
+            # Split the event file into its games using the offset index
+            if by_game or game_id:
+                for gid, start, end in index_games(path):
+                    if game_id and gid != game_id:
+                        continue
+                    tasks.append(Task(year, team['id'], team['league'], name,
+                                      gid, end-start, (start, end)))
+            else:
+                tasks.append(Task(year, team['id'], team['league'], name,
+                                  '', os.path.getsize(path)))
+    tasks.sort(key=lambda task: task.size, reverse=True)
+    return tasks
+
+# Processes a single task in a worker.
+#
+# Input:
+#  - config (Configuration): input configuration
+#  - task (Task): unit of work
+#  - proc_kwargs (dict): keyword arguments for the processor
+#
+# Output:
+#  The processor that processed the task
+def process_task(config, task, proc_kwargs):
+    proc = Processor(config, **proc_kwargs)
+    # Progress is shown by the monitor instead when there is one
+    if not proc.progress:
+        if task.game:
+            print(f'PROCESSING {task.game}')
+        else:
+            print(f'PROCESSING {task.year} {task.name}')
+    proc.process_team(task.year, task.team, task.league, task.game, task.span)
+    return proc
+
+# Default worker function, processes the task and returns nothing.
+def run_task(config, task, proc_kwargs):
+    process_task(config, task, proc_kwargs)
+
+# Runs every task on one pool of workers.
+#
+# Tasks are handed out one at a time in the given order, so the longest tasks
+# start first and the short ones fill in the tail.
+#
+# Input:
+#  - config (Configuration): input configuration
+#  - tasks (list): tasks from build_tasks()
+#  - njobs (int): number of workers
+#  - task_fn (function): optional, worker function with run_task's signature
+#  - progress (bool): optional, show a live progress line for the whole run
+#  - proc_kwargs: keyword arguments for the processor
+#
+# Output:
+#  List of task_fn return values, in task order
+def run(config, tasks, njobs, task_fn=run_task, progress=False, **proc_kwargs):
+    parallel = Parallel(n_jobs=njobs, batch_size=1, pre_dispatch='all')
+    if not progress:
+        return parallel(delayed(task_fn)(config, task, proc_kwargs) for task in tasks)
+    with ProgressMonitor(sum(task.size for task in tasks)) as monitor:
+        proc_kwargs = dict(proc_kwargs, progress=monitor.queue)
+        return parallel(delayed(task_fn)(config, task, proc_kwargs) for task in tasks)
@@ -0,0 +1,140 @@
+# This file defines the bulk verifier that cross references the accumulated
+# player stats with the retrosplits data.
+
+# External imports
+import numpy as np
+import os
+import pandas as pd
+
+# Internal imports
+from players.stats.batting import BattingStats
+from players.stats.pitching import PitchingStats
+
+# Key columns of the accumulator and discrepancy tables
+key_cols = ['game.key', 'person.key']
+
+# Stat columns that are compared against retrosplits
+#
+# IRS doesn't currently work if a pitcher inherits some runners, gets replaced,
+# and the replacement pitcher allows those runners to score. In this case, both
+# pitchers should be charged with IRSs.
+#
+# I've found inconsistencies between my calculation here, baseball reference,
+# and retrosplits on pitch counts. In these instances, my count agrees with
+# baseball reference. To avoid throwing errors in these instances, I will forgo
+# checking pitch stats and trust that my own count is more accurate than
+# retrosplits.
+skip_stats = ['IRS', 'PITCH', 'STRIKE']
+stat_cols = (['B_'+s for s in BattingStats.counting_stats if not s in skip_stats] +
+             ['P_'+s for s in PitchingStats.counting_stats if not s in skip_stats])
+
+
+class StatVerifier:
+    def __init__(self):
+        # One row of in-game accumulators per player per game
+        self.rows = []
+
+    # Records the in-game stats of every player who appeared in the game.
+    #
+    # Input:
+    #  - game (GameState): finished game
+    #
+    # Output:
+    #  None
+    def record_game(self, game):
+        for team in game.teams:
+            for plyr in team.roster.values():
+                row = {'game.key': game.id,
+                       'person.key': plyr.id,
+                       'team.key': team.id,
+                       'name': plyr.name}
+                for prefix, stats_obj, stats in (('B_', plyr.batting, BattingStats.counting_stats),
+                                                 ('P_', plyr.pitching, PitchingStats.counting_stats)):
+                    for stat in stats:
+                        row[prefix+stat] = stats_obj.in_game_stats[stat] if stats_obj else 0
+                self.rows.append(row)
+
+    # Returns the recorded accumulators as a dataframe.
+    def frame(self):
+        return pd.DataFrame(self.rows, columns=key_cols+['team.key', 'name']+stat_cols)
+
+
+# Reads the retrosplits stats for the given season.
+#
+# If the season's retrosplits day-by-day file, playing-{year}.csv, is in the
+# stat path, then it is read once. Otherwise, the stat path is treated as a
+# directory of per player files, and each player's file is read once.
+#
+# Input:
+#  - stat_path (str): path to the retrosplits data
+#  - year (int): season to be read
+#  - pids (iterable): player ids to read when using per player files
+#
+# Output:
+#  Dataframe with the key columns and the stat columns
+def load_truth(stat_path, year, pids):
+    season_file = stat_path+f'/playing-{year}.csv'
+    if os.path.isfile(season_file):
+        truth = pd.read_csv(season_file, usecols=lambda c: c in key_cols+stat_cols)
+    else:
+        frames = []
+        for pid in sorted(set(pids)):
+            player_file = stat_path+f'/{pid}.csv'
+            if not os.path.isfile(player_file):
+                continue
+            df = pd.read_csv(player_file, usecols=lambda c: c in key_cols+stat_cols)
+            df['person.key'] = pid
+            frames.append(df)
+        truth = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=key_cols)
+    for col in stat_cols:
+        if not col in truth.columns:
+            truth[col] = 0
+    truth = truth[truth['game.key'].str[3:7] == str(year)]
+    # Retrosplits can split a player's game over multiple rows
+    return truth.groupby(key_cols, as_index=False)[stat_cols].sum()
+
+
+# Joins the accumulators for a whole season against retrosplits and returns
+# a table with one row per mismatched stat.
+#
+# Input:
+#  - accum (Dataframe): accumulators from StatVerifier.frame()
+#  - stat_path (str): path to the retrosplits data
+#  - year (int): season being verified
+#
+# Output:
+#  Dataframe with columns [game.key, team.key, person.key, name, stat, expected, got]
+def verify_season(accum, stat_path, year):
+    truth = load_truth(stat_path, year, accum['person.key'])
+    merged = accum.merge(truth, on=key_cols, how='left', suffixes=('', '.truth'))
+    got = merged[stat_cols].to_numpy(dtype=np.int64)
+    expected = merged[[col+'.truth' for col in stat_cols]].fillna(0).to_numpy(dtype=np.int64)
+    # Locate every mismatched (player game, stat) cell at once
+    rows, cols = np.nonzero(expected != got)
+    return pd.DataFrame({'game.key': merged['game.key'].to_numpy()[rows],
+                         'team.key': merged['team.key'].to_numpy()[rows],
+                         'person.key': merged['person.key'].to_numpy()[rows],
+                         'name': merged['name'].to_numpy()[rows],
+                         'stat': np.array(stat_cols)[cols],
+                         'expected': expected[rows, cols],
+                         'got': got[rows, cols]})
+
+
+# Verifies a season and writes the discrepancy table to disk.
+#
+# Input:
+#  - accum (Dataframe): accumulators from StatVerifier.frame()
+#  - stat_path (str): path to the retrosplits data
+#  - year (int): season being verified
+#  - output (str): directory the discrepancy table is written to
+#
+# Output:
+#  Discrepancy dataframe
+def write_discrepancies(accum, stat_path, year, output='./discrepancies'):
+    errors = verify_season(accum, stat_path, year)
+    if not os.path.exists(output):
+        os.makedirs(output)
+    errors.to_csv(output+f'/{year}-discrepancies.csv', index=False)
+    print(f"{len(errors)} stat error(s) in {errors['game.key'].nunique()} of "
+          f"{accum['game.key'].nunique()} games. See {output}/{year}-discrepancies.csv")
+    return errors
@@ -0,0 +1,56 @@
+# This file defines the background writer for the processor.
+#
+# Writing game outputs, stat shards and logs to disk is handed off to a thread
+# so the processor can keep parsing the event file while the writes happen.
+# Jobs are queued on a bounded queue. If the writer falls behind, submitting a
+# job blocks until there is room, which keeps the number of finished games held
+# in memory bounded.
+
+# External imports
+import queue
+import threading
+
+
+class BackgroundWriter:
+    def __init__(self, maxsize=8):
+        self.queue = queue.Queue(maxsize=maxsize)
+        # First exception raised by a job, re-raised in the processor's thread
+        self.error = None
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    # Runs jobs until the stop signal (None) is received.
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            fn, args = job
+            # Once a job fails, skip the rest so the error surfaces quickly.
+            if self.error is None:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    self.error = e
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    # Queues a job, blocking while the queue is full.
+    #
+    # Input:
+    #  - fn (function): job to be run on the writer thread
+    #  - args: arguments for the job
+    #
+    # Output:
+    #  None
+    def submit(self, fn, *args):
+        self.check()
+        self.queue.put((fn, args))
+
+    # Waits for the queued jobs to finish and stops the thread.
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
@@ -0,0 +1,118 @@
+# This file defines the bullpen and bench features of a team.
+#
+# The team features otherwise only cover the nine batters in the lineup and the
+# pitcher on the mound. The aggregates summarize the rest of the team's season
+# roster (the Retrosheet {team}{year}.ROS file), read from the stats store up
+# to the game like the players in it:
+#
+#  - bullpen: the roster pitchers outside the game who pitched mostly in relief
+#             over the longest pitching interval and have appeared in the last
+#             rest_cap days. Each reliever is weighted by his rest, a reliever
+#             who pitched yesterday counts for a third of a rested one and one
+#             who already pitched today doesn't count.
+#  - bench:   the roster position players outside the game who have played in
+#             the last rest_cap days, weighted equally.
+#
+# The features are the weighted averages of the players' batting or pitching
+# features, BP_{feature} for the bullpen and BN_{feature} for the bench, plus
+# BP_n and BN_n, the total weight of the players. They are computed once per
+# game, when the team is first featurized, so the starters are known.
+
+# External imports
+import numpy as np
+import os
+import pandas as pd
+
+# Internal imports
+from players.fatigue import rest_cap
+from players.stats.batting import BattingStats
+from players.stats.pitching import PitchingStats
+from players.store import store_path
+from processors.reference import team_roster
+
+aggregates = ['bullpen', 'bench']
+
+# Days of rest after which a reliever counts fully
+full_rest = 3
+
+# Reduces the players' features to their weighted average.
+#
+# Input:
+#  - feats (list): Series of each player's features
+#  - weights (list): weight of each player
+#  - names (list): feature names
+#  - prefix (str): prefix of the aggregate features
+#
+# Output:
+#  Series of the aggregate features
+def weighted_average(feats, weights, names, prefix):
+    weights = np.array(weights, dtype=np.float64)
+    values = np.zeros(len(names))
+    if weights.sum() > 0:
+        values = weights @ np.vstack([f[names].to_numpy(dtype=np.float64) for f in feats]) / weights.sum()
+    agg_feats = pd.Series(values, index=[prefix+name for name in names], dtype=np.float64)
+    agg_feats[prefix+'n'] = weights.sum()
+    return agg_feats
+
+
+class RosterAggregates:
+    # Input:
+    #  - config (Configuration): configuration, team_aggregates picks the
+    #                            aggregates
+    #  - game_id (str): current game id
+    #  - rospath (str): path to the team's roster file
+    def __init__(self, config, game_id, rospath):
+        for agg in config.team_aggregates:
+            assert(agg in aggregates), f'Unknown team aggregate {agg}'
+        self.config = config
+        self.game_id = game_id
+        self.rospath = rospath
+        self.features = None
+
+    def featurize(self, team):
+        if self.features is None:
+            roster_df = team_roster(self.rospath)
+            # Players outside the game that have stats to read
+            candidates = [pid for pid in roster_df['id'] if not pid in team.roster and
+                                                           os.path.isfile(store_path+f'/{pid}.csv')]
+            pitchers = set(roster_df.loc[roster_df['pos'] == 'P', 'id'])
+            feats = []
+            if 'bullpen' in self.config.team_aggregates:
+                feats.append(self.featurize_bullpen([pid for pid in candidates if pid in pitchers]))
+            if 'bench' in self.config.team_aggregates:
+                feats.append(self.featurize_bench([pid for pid in candidates if not pid in pitchers]))
+            self.features = pd.concat(feats)
+        return self.features
+
+    def featurize_bullpen(self, pids):
+        stat_features = list(self.config.pitching_feats)
+        # Rest is needed for the weights
+        read_features = stat_features + ([] if 'Rest' in stat_features else ['Rest'])
+        longest = max(self.config.pitching_intervals)
+        feats, weights = [], []
+        for pid in pids:
+            stats = PitchingStats(self.game_id, pid, read_features, self.config.pitching_intervals, played=False)
+            player_feats = stats.featurize()
+            rest = stats.fatigue['Rest']
+            if rest >= rest_cap or stats.stats[longest]['GS'] > stats.stats[longest]['G']/2:
+                continue
+            feats.append(player_feats)
+            weights.append(min(rest/full_rest, 1))
+        names = [f'P_G{i}_{stat}' for i in self.config.pitching_intervals for stat in stat_features
+                                  if not stat in PitchingStats.fatigue_stats]
+        names += ['P_'+stat for stat in stat_features if stat in PitchingStats.fatigue_stats]
+        agg_feats = weighted_average(feats, weights, names, 'BP_')
+        return agg_feats.rename(lambda s: s.replace('BP_P_', 'BP_'))
+
+    def featurize_bench(self, pids):
+        today = pd.Timestamp(f'{self.game_id[3:7]}-{self.game_id[7:9]}-{self.game_id[9:11]}')
+        feats, weights = [], []
+        for pid in pids:
+            stats = BattingStats(self.game_id, pid, self.config.batting_feats, self.config.batting_intervals, played=False)
+            player_feats = stats.featurize()
+            if stats.last_date is None or (today - stats.last_date).days >= rest_cap:
+                continue
+            feats.append(player_feats)
+            weights.append(1)
+        names = [f'G{i}_{stat}' for i in self.config.batting_intervals for stat in self.config.batting_feats]
+        return weighted_average(feats, weights, names, 'BN_')
@@ -0,0 +1,142 @@
+# This file defines the team history features.
+#
+# The team file of the stats store (see players/store.py) has a row of each
+# team's runs and summed counting stats for every game it played. TeamIndex
+# sorts it by team and game and keeps the running totals, so a team's stats
+# over its last N games are the difference of two rows, found with a binary
+# search for the team and another for the game.
+#
+# Rolling stats, over the team's last N games before the current one:
+#  * T_G{int}_RS   - Runs scored per game
+#  * T_G{int}_RA   - Runs allowed per game
+#  * T_G{int}_wOBA - Team weighted on-base average
+#  * T_G{int}_FIP  - Team fielding independent pitching
+#
+# Schedule stats:
+#  * T_Rest - Days since the team's last game, 0 for the second game of a
+#             doubleheader, capped at rest_cap and at it for the first game
+#             of a season
+#  * T_DH   - 1 for either game of a doubleheader
+#  * T_Road - Games into the current road trip, counting this one, 0 at home
+
+# External imports
+from functools import lru_cache
+import numpy as np
+import os
+import pandas as pd
+
+# Internal imports
+from players.fatigue import rest_cap
+from players.store import team_batting_stats, team_path
+from processors.reference import woba_weights
+
+rolling_feats = ['RS', 'RA', 'wOBA', 'FIP']
+schedule_feats = ['Rest', 'DH', 'Road']
+feats = rolling_feats + schedule_feats
+
+# Game id to its day number, and to a number that orders games by date and
+# game number
+day_of = lambda game_id: np.datetime64(f'{game_id[3:7]}-{game_id[7:9]}-{game_id[9:11]}', 'D').astype(np.int64)
+order_of = lambda game_id: int(game_id[3:])
+
+
+class TeamIndex:
+    def __init__(self, path=team_path):
+        assert(os.path.isfile(path)), f'{path} not found, the stats must be built before the team features'
+        df = pd.read_csv(path)
+        order = np.array([order_of(key) for key in df['game.key']], dtype=np.int64)
+        teams = df['team'].to_numpy().astype(str)
+        sort = np.lexsort((order, teams))
+        df = df.iloc[sort].reset_index(drop=True)
+        self.teams = teams[sort]
+        self.order = order[sort]
+        self.days = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        # Weighted total bases and FIP constant times batters faced of each
+        # row, with the weights of its season
+        w = woba_weights().set_index('Season').reindex(self.order // 100000)
+        col = lambda name: df[name].to_numpy(dtype=np.float64)
+        singles = col('B_H') - col('B_2B') - col('B_3B') - col('B_HR') - col('B_HR4')
+        wtb = (w['wBB'].to_numpy()*col('B_BB') + w['wHBP'].to_numpy()*col('B_HP') + w['w1B'].to_numpy()*singles +
+               w['w2B'].to_numpy()*col('B_2B') + w['w3B'].to_numpy()*col('B_3B') +
+               w['wHR'].to_numpy()*(col('B_HR')+col('B_HR4')))
+        fip = 13*(col('P_HR')+col('P_HR4')) + 3*(col('P_BB')+col('P_HP')) - 2*col('P_SO')
+        ctbf = w['cFIP'].to_numpy()*col('P_TBF')
+        self.columns = (['R', 'RA'] + ['B_'+bstat for bstat in team_batting_stats] +
+                        ['wTB', 'FIP', 'cTBF', 'P_OUT', 'P_TBF'])
+        values = np.column_stack([col('R'), col('RA')] + [col('B_'+bstat) for bstat in team_batting_stats] +
+                                 [np.nan_to_num(wtb), fip, np.nan_to_num(ctbf), col('P_OUT'), col('P_TBF')])
+        # Running totals with a leading row of zeros, the totals of rows
+        # [lo, hi) are totals[hi] - totals[lo]
+        self.totals = np.vstack([np.zeros((1, len(self.columns))), np.cumsum(values, axis=0)])
+        # Length of the road trip each row ends, 0 for home games. Trips
+        # start over at each team's first game of a season
+        away = df['home'].to_numpy() == 0
+        first = np.r_[True, (self.teams[1:] != self.teams[:-1]) |
+                            (self.order[1:] // 100000 != self.order[:-1] // 100000)]
+        rows = np.arange(len(df))
+        last_reset = np.maximum.accumulate(np.where(~away, rows, np.where(first, rows-1, -1)))
+        self.road = np.where(away, rows - last_reset, 0)
+
+    # Finds a team's games before a game.
+    #
+    # Output:
+    #  (first row of the team, row of the game), the team's games before the
+    #  game are the rows in between
+    def lookup(self, team_id, game_id):
+        start = np.searchsorted(self.teams, team_id, side='left')
+        end = np.searchsorted(self.teams, team_id, side='right')
+        return start, start + np.searchsorted(self.order[start:end], order_of(game_id), side='left')
+
+    # Sums the team's stats over rows [lo, hi).
+    def totals_between(self, lo, hi):
+        return dict(zip(self.columns, self.totals[hi] - self.totals[lo]))
+
+
+# The index is built once per process
+@lru_cache(maxsize=None)
+def load_index():
+    return TeamIndex()
+
+
+class TeamHistory:
+    # Input:
+    #  - stat_features (list): features, see feats
+    #  - intervals (list): game intervals of the rolling stats
+    #  - game_id (str): current game id
+    #  - home (bool): the team is the home team
+    def __init__(self, stat_features, intervals, game_id, home):
+        for stat in stat_features:
+            assert(stat in feats), f'Unknown team feature {stat}'
+        self.stat_features = list(stat_features)
+        self.intervals = list(intervals)
+        self.game_id = game_id
+        self.home = home
+        self.index = load_index()
+        self.features = None
+
+    def featurize(self, team):
+        if self.features is None:
+            start, present = self.index.lookup(team.id, self.game_id)
+            feat_dict = {}
+            for i in self.intervals:
+                lo = max(present-i, start)
+                sts = self.index.totals_between(lo, present)
+                games = present - lo
+                denom = sts['B_AB']+sts['B_BB']-sts['B_IBB']+sts['B_SF']+sts['B_HP']
+                rolling = {'RS': sts['R']/games if games else 0,
+                           'RA': sts['RA']/games if games else 0,
+                           'wOBA': sts['wTB']/denom if denom else 0,
+                           'FIP': sts['FIP']/(sts['P_OUT']/3) + sts['cTBF']/sts['P_TBF'] if sts['P_OUT'] else 0}
+                for stat in self.stat_features:
+                    if stat in rolling_feats:
+                        feat_dict[f'T_G{i}_{stat}'] = rolling[stat]
+            # The road trip and rest don't carry over from last season
+            last = present-1 if present > start and self.index.order[present-1] // 100000 == order_of(self.game_id) // 100000 else None
+            schedule = {'Rest': min(day_of(self.game_id) - self.index.days[last], rest_cap) if last is not None else rest_cap,
+                        'DH': int(self.game_id[-1] != '0'),
+                        'Road': 0 if self.home else (self.index.road[last] + 1 if last is not None else 1)}
+            for stat in self.stat_features:
+                if stat in schedule_feats:
+                    feat_dict[f'T_{stat}'] = schedule[stat]
+            self.features = pd.Series(feat_dict, dtype=np.float64)
+        return self.features
@@ -7,6 +7,7 @@ import pandas as pd
 # Internal imports
 from players.stats.batting import BattingStats
 from players.stats.pitching import PitchingStats
+from processors.reference import season_teams
 
 class Team:
     def __init__(self, tid):
@@ -16,6 +17,8 @@ class Team:
         self.lineup = [None for _ in range(9)] # list of player ids.
         self.pitcher = None
         self.bpos = 0 # Batting position (zero-indexed)
+        self.aggregates = None # Bullpen and bench features, see teams/aggregates.py
+        self.history = None # Team history features, see teams/history.py
 
     # Adds team name
     #
@@ -25,8 +28,7 @@ class Team:
     # Output:
     #  None
     def add_team_name(self, teamspath):
-        teams_df = pd.read_csv(teamspath, header=None)
-        teams_df.columns = ['id', 'league', 'city', 'name']
+        teams_df = season_teams(teamspath)
         if not np.any(teams_df['id'] == self.id):
             print(f'{self.id} not found in {teamspath}')
             assert(False)
@@ -50,7 +52,12 @@ class Team:
         batting_feats = self.featurize_batting()
         pitching_feats = self.featurize_pitching()
         fielding_feats = self.featurize_fielding()
-        return pd.concat([batting_feats, pitching_feats, fielding_feats])
+        feats = [batting_feats, pitching_feats, fielding_feats]
+        if self.aggregates:
+            feats.append(self.aggregates.featurize(self))
+        if self.history:
+            feats.append(self.history.featurize(self))
+        return pd.concat(feats)
     
     # NOTE - Should these be moved into a stats parent object?
     stat_dict = {'batting':  [BattingStats.counting_stats],
@@ -104,76 +111,3 @@ class Team:
                     row += ' ' * (max_stat_width - len(value))
                 print(row)
             print()
-
-    # Cross references the player stats with the retrosplit data.
-    def verify_game_stats(self, game_id, stat_path):
-        max_name_width = max([len(name) for name in [p.name for p in self.roster.values()]]) + 2
-        max_stat_width = 5
-        error_cnt = 0
-        for plyr in self.roster.values():
-            # For each stat type given, either 'batting', 'pitching', or 'both'.
-            for stats in Team.stat_dict['both']:
-                # Get the player's stat object and prefix according to the stat type.
-                plyr_stats_obj, prefix = (
-                                        (plyr.batting, 'B_') 
-                                        if stats == BattingStats.counting_stats 
-                                        else (plyr.pitching, 'P_')
-                )
-                # Get the truth dictionary from the input stat path.
-                truth_dict = (
-                            dict.fromkeys([prefix+stat for stat in stats], 0)
-                            if not plyr_stats_obj
-                            else plyr_stats_obj.get_game_stats(game_id, stat_path)
-                )
-                # Get the in-game stats dict from the player's stats object.
-                plyr_stats_dict = (
-                                    dict.fromkeys(stats, 0) 
-                                    if not plyr_stats_obj
-                                    else plyr_stats_obj.in_game_stats
-                )
-                # Check each of the player's stats against the truth.
-                for stat in stats:
-                    # This stat currently doesn't work if a pitcher inherts some runners,
-                    # gets replaced, and the replacement pitcher allows those runners to
-                    # score. In this case, both pitchers should be charged with IRSs.
-                    #
-                    # I've found inconsistencies between my calculation here, baseball 
-                    # reference, and retrosplits on pitch counts. In these instances,
-                    # my count agrees with baseball reference. To avoid throwing errors
-                    # in these instances, I will forgo checking pitch stat and trust
-                    # that my own count is more accurate than retrosplits.
-                    #
-                    if stat == 'IRS' or stat == 'PITCH' or stat == 'STRIKE':
-                        continue
-                    if truth_dict[prefix+stat] != plyr_stats_dict[stat]:
-                        # Stat that is actually printed.
-                        prnt_stat = stat if not stat in Team.stat_abrv else Team.stat_abrv[stat]
-                        # Build the stat error string.
-                        line = 'STAT ERROR: Player: ' + plyr.name
-                        line += ' ' * (max_name_width - len(plyr.name))
-                        line += 'Stat: ' + prnt_stat
-                        line += ' ' * (max_stat_width + 1 - len(prnt_stat))
-                        line += 'Expected: ' + str(int(truth_dict[prefix+stat]))
-                        line += ' ' * (max_stat_width - len(str(int(truth_dict[prefix+stat]))))
-                        line += 'Got: ' + str(plyr_stats_dict[stat])
-                        error_cnt += 1
-                        # Print a header with team stats if this is the first error
-                        if error_cnt == 1:
-                            print()
-                            self.print_game_stats(stat_path)
-                            print()
-                            print()
-                            print(f'{self.name} - Player stat verification')
-                        # Print the stat error.
-                        print(line)
-        if error_cnt:
-            print(f'{int(error_cnt)} stat error(s).')
-            print()
-            print('Game ID:', self.id)
-            print()
-        return (error_cnt == 0) # Return true if there are no errors.
-    
-    # Save the game stats for each player on the team.
-    def save_stats(self, game_id, game_date, overwrite=False):
-        for plyr in self.roster.values():
-            plyr.save_stats(game_id, game_date, overwrite=overwrite)